@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        from . import profiling
+
+        # Обёртка ничего не делает вне профилируемого запроса
+        for connection in connections.all(initialized_only=True):
+            profiling.install_sql_wrapper(connection)
+        connection_created.connect(profiling.install_sql_wrapper)
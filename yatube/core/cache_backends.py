@@ -0,0 +1,468 @@
+"""Двухуровневый кеш: LRU в памяти процесса перед общим кешем.
+
+SQLiteCache — общий уровень в отдельном файле SQLite: его видят все
+воркеры, а внешние сервисы не нужны. TwoTierCache держит перед ним
+небольшой LRU с ограничением по числу записей, объёму и времени жизни.
+
+Согласованность: триггеры SQLiteCache пишут в журнал changes ключ
+каждой строки, которую меняет или удаляет любая запись (set поверх
+ключа, add поверх просроченного, incr, touch, delete, clear, чистка).
+Процесс читает новые строки журнала не чаще раза в SYNC_INTERVAL
+секунд и выбрасывает из своего LRU только эти ключи, так что чужие
+изменения видны не позже этого интервала, а остальные записи LRU
+остаются на месте. Локальная копия живёт не дольше LOCAL_TIMEOUT и не
+дольше записи в общем кеше.
+"""
+import itertools
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import profiling
+
+# Сколько строк журнала процесс читает за одну сверку; отстал сильнее —
+# сбрасывает весь LRU
+CHANGES_BATCH = 1000
+
+_MISSING = object()
+
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS cache
+    (key TEXT PRIMARY KEY, value NOT NULL, expires REAL);
+CREATE TABLE IF NOT EXISTS changes
+    (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL,
+     at REAL NOT NULL);
+CREATE TRIGGER IF NOT EXISTS cache_updated AFTER UPDATE ON cache BEGIN
+    INSERT INTO changes (key, at) VALUES (old.key, {_NOW});
+END;
+CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN
+    INSERT INTO changes (key, at) VALUES (old.key, {_NOW});
+END;
+'''
+
+
+class SQLiteCache(BaseCache):
+    """Общий для процессов кеш в файле SQLite (LOCATION — путь к файлу).
+
+    Целые числа хранятся как INTEGER, поэтому incr атомарен. Изменённые
+    и удалённые ключи попадают в журнал (см. changes) и хранятся в нём
+    OPTIONS['CHANGES_TIMEOUT'] секунд. Ключи, содержащие одну из строк
+    OPTIONS['KEEP_KEYS'], чистка не удаляет.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._changes_timeout = float(options.get('CHANGES_TIMEOUT', 300))
+        self._keep_keys = tuple(options.get('KEEP_KEYS', ()))
+        self._local = threading.local()
+        self._writes = itertools.count(1)
+
+    @property
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=20,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _live(self):
+        return '(expires IS NULL OR expires > ?)', time.time()
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        live, now = self._live()
+        row = self._db.execute(
+            f'SELECT value FROM cache WHERE key = ? AND {live}',
+            (key, now)).fetchone()
+        return default if row is None else self._load(row[0])
+
+    def get_many(self, keys, version=None):
+        return {key: value for key, (value, expires)
+                in self.get_entries(keys, version=version).items()}
+
+    def get_entries(self, keys, version=None):
+        """Как get_many, но {ключ: (значение, expires)}.
+
+        expires — момент истечения по time.time() или None для вечных.
+        """
+        made = {self.make_and_validate_key(key, version=version): key
+                for key in keys}
+        if not made:
+            return {}
+        live, now = self._live()
+        placeholders = ', '.join('?' * len(made))
+        rows = self._db.execute(
+            f'SELECT key, value, expires FROM cache '
+            f'WHERE key IN ({placeholders}) AND {live}',
+            (*made, now))
+        return {made[key]: (self._load(value), expires)
+                for key, value, expires in rows}
+
+    def changes(self, after=None, limit=CHANGES_BATCH):
+        """Ключи, изменённые после строки журнала after.
+
+        Возвращает (последняя строка, ключи). Ключей None, если часть
+        журнала после after уже вычищена или строк больше limit: тогда
+        изменённым надо считать всё. after=None — просто текущая строка.
+        """
+        db = self._db
+        db.execute('BEGIN')
+        try:
+            row = db.execute("SELECT seq FROM sqlite_sequence "
+                             "WHERE name = 'changes'").fetchone()
+            last = row[0] if row else 0
+            if after is None or after >= last:
+                return last, []
+            rows = db.execute(
+                'SELECT seq, key FROM changes WHERE seq > ? '
+                'ORDER BY seq LIMIT ?', (after, limit)).fetchall()
+        finally:
+            db.execute('COMMIT')
+        if not rows or rows[0][0] != after + 1 or rows[-1][0] != last:
+            return last, None
+        return last, [key for seq, key in rows]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # UPSERT, а не REPLACE: перезапись должна пройти через триггер
+        self._db.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires',
+            (key, self._dump(value), self.get_backend_timeout(timeout)))
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # Вставка либо замена только просроченного значения
+        cursor = self._db.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, self._dump(value), self.get_backend_timeout(timeout),
+             time.time()))
+        self._maybe_cull()
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        live, now = self._live()
+        cursor = self._db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {live}',
+            (self.get_backend_timeout(timeout), key, now))
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        live, now = self._live()
+        row = self._db.execute(
+            f'UPDATE cache SET value = value + ? WHERE key = ? AND {live} '
+            f"AND typeof(value) = 'integer' RETURNING value",
+            (delta, key, now)).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        return row[0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        live, now = self._live()
+        return self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {live}',
+            (key, now)).fetchone() is not None
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение потока переживает запрос, как CONN_MAX_AGE у базы
+        pass
+
+    def _maybe_cull(self):
+        # Подсчёт строк недешёв, поэтому проверяем раз в сотню записей
+        if next(self._writes) % 100:
+            return
+        db = self._db
+        now = time.time()
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            # Первыми уходят записи, которым и так скоро истекать;
+            # бессрочные — последними, в порядке вставки
+            keep = ''.join(' AND instr(key, ?) = 0' for _ in self._keep_keys)
+            db.execute(
+                f'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                f'WHERE 1{keep} ORDER BY expires IS NULL, expires, rowid '
+                f'LIMIT ?)',
+                (*self._keep_keys, count // self._cull_frequency))
+        db.execute('DELETE FROM changes WHERE at <= ?',
+                   (now - self._changes_timeout,))
+
+
+class _LocalStore:
+    """LRU одного процесса; общий для всех потоков, как у LocMemCache."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        # Последняя прочитанная строка журнала общего кеша
+        self.seq = None
+        self.checked = 0.0
+        self.stats = dict.fromkeys(
+            ('local_hits', 'local_misses', 'shared_hits', 'shared_misses'),
+            0)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            pickled, expires = entry
+            if expires <= time.monotonic():
+                self._pop(key)
+                return _MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, ttl, max_entries, max_bytes, seq):
+        if ttl <= 0:
+            self.delete(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(pickled) > max_bytes:
+            self.delete(key)
+            return
+        with self.lock:
+            self._pop(key)
+            if seq != self.seq:
+                # Журнал сверили, пока значение читалось из общего кеша:
+                # ключ мог измениться, копию не сохраняем
+                return
+            self.entries[key] = (pickled, time.monotonic() + ttl)
+            self.size += len(pickled)
+            while (len(self.entries) > max_entries
+                   or self.size > max_bytes):
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    """LRU процесса перед общим кешем из CACHES[OPTIONS['SHARED']].
+
+    Общий кеш — SQLiteCache: LRU опирается на его журнал изменений.
+    LOCATION называет LRU: экземпляры с одним LOCATION в процессе
+    делят его между потоками. Ключи LRU — ключи общего кеша, с его
+    KEY_PREFIX и версией.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_max_entries = int(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._local_max_bytes = int(
+            options.get('LOCAL_MAX_BYTES', 16 * 1024 * 1024))
+        self._local_timeout = float(options.get('LOCAL_TIMEOUT', 60))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 1))
+        with _stores_lock:
+            self._store = _stores.setdefault(location, _LocalStore())
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def stats(self):
+        """Попадания и промахи по уровням с момента запуска процесса."""
+        store = self._store
+        with store.lock:
+            return {**store.stats, 'local_entries': len(store.entries),
+                    'local_bytes': store.size}
+
+    def _made(self, key, version):
+        return self.shared.make_and_validate_key(key, version=version)
+
+    def _ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def _remember(self, made, value, ttl, seq):
+        self._store.set(made, value, ttl, self._local_max_entries,
+                        self._local_max_bytes, seq)
+
+    def _remember_entry(self, made, value, expires, seq):
+        # Копия не должна пережить запись в общем кеше
+        ttl = self._local_timeout
+        if expires is not None:
+            ttl = min(ttl, expires - time.time())
+        self._remember(made, value, ttl, seq)
+
+    def _sync(self):
+        """Выбросить из LRU ключи, изменённые с прошлой сверки."""
+        store = self._store
+        now = time.monotonic()
+        if now - store.checked < self._sync_interval:
+            return store.seq
+        seq, keys = self.shared.changes(store.seq)
+        with store.lock:
+            store.checked = now
+            if keys is None:
+                store.entries.clear()
+                store.size = 0
+            else:
+                for key in keys:
+                    store._pop(key)
+            if store.seq is None or seq > store.seq:
+                store.seq = seq
+            return store.seq
+
+    def get(self, key, default=None, version=None):
+        made = self._made(key, version)
+        seq = self._sync()
+        value = self._store.get(made)
+        if value is not _MISSING:
+            self._store.count('local_hits')
+            profiling.count_cache(1, 0)
+            return value
+        self._store.count('local_misses')
+        entry = self.shared.get_entries([key], version=version).get(key)
+        if entry is None:
+            self._store.count('shared_misses')
+            profiling.count_cache(0, 1)
+            return default
+        self._store.count('shared_hits')
+        profiling.count_cache(1, 0)
+        self._remember_entry(made, *entry, seq)
+        return entry[0]
+
+    def get_many(self, keys, version=None):
+        seq = self._sync()
+        found, missing = {}, []
+        for key in keys:
+            value = self._store.get(self._made(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        store = self._store
+        with store.lock:
+            store.stats['local_hits'] += len(found)
+            store.stats['local_misses'] += len(missing)
+        if missing:
+            shared = self.shared.get_entries(missing, version=version)
+            with store.lock:
+                store.stats['shared_hits'] += len(shared)
+                store.stats['shared_misses'] += len(missing) - len(shared)
+            for key, entry in shared.items():
+                self._remember_entry(self._made(key, version), *entry, seq)
+                found[key] = entry[0]
+        profiling.count_cache(len(found), len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self._made(key, version)
+        seq = self._sync()
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(made, value, self._ttl(timeout), seq)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self._made(key, version)
+        seq = self._sync()
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        self._remember(made, value, self._ttl(timeout), seq)
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        seq = self._sync()
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(self._made(key, version), value,
+                               self._ttl(timeout), seq)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        # Срок копии в LRU привязан к старому сроку записи
+        self._store.delete(self._made(key, version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Срок записи incr не возвращает: копия перечитается из общего
+        self._store.delete(self._made(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._store.delete(self._made(key, version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._store.delete(self._made(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        made = self._made(key, version)
+        self._sync()
+        if self._store.get(made) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self._store.clear()
+        # Удалённые строки попадут в журнал, остальные процессы выбросят
+        # их из своих LRU
+        self.shared.clear()
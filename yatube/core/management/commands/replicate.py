@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replication import replicate
+from core.routers import replicas
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплики из DATABASE_REPLICAS; '
+            'с --interval повторяет копирование, имитируя отставание')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Пауза между копиями в секундах, 0 — '
+                                 'скопировать один раз')
+
+    def handle(self, *args, **options):
+        if not replicas():
+            raise CommandError('DATABASE_REPLICAS пуст: запустите с '
+                               '--settings yatube.settings_replica')
+        while True:
+            started = time.monotonic()
+            replicate()
+            self.stdout.write(
+                f'Реплики обновлены за {time.monotonic() - started:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
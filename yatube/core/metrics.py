@@ -0,0 +1,236 @@
+"""Метрики в текстовом формате Prometheus без внешнего сборщика.
+
+Каждый процесс копит счётчики и гистограммы в памяти и не чаще раза в
+METRICS['FLUSH_INTERVAL'] секунд сбрасывает их в свой файл
+METRICS['DIR']/<pid>.json. Файл пишется целиком и подменяется через
+os.replace, так что читатель не увидит его наполовину. /metrics
+складывает файлы всех воркеров: счётчики и гистограммы суммируются,
+в том числе от уже завершившихся процессов, а показания (gauge)
+берутся только у живых. Каталог очищают при перезапуске сервиса,
+иначе файлы давно ушедших воркеров копятся.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+           math.inf)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+METRICS = {
+    'yatube_http_requests_total': (
+        COUNTER, 'Обработанные запросы по представлениям'),
+    'yatube_http_request_duration_seconds': (
+        HISTOGRAM, 'Время ответа представления'),
+    'yatube_db_queries_total': (
+        COUNTER, 'Запросы к базе, сделанные при обработке запросов'),
+    'yatube_db_query_seconds_total': (
+        COUNTER, 'Суммарное время запросов к базе'),
+    'yatube_cache_requests_total': (
+        COUNTER, 'Чтения из кеша по уровням и результату'),
+    'yatube_thumbnail_generation_seconds': (
+        HISTOGRAM, 'Время подготовки миниатюр одного поста'),
+    'yatube_thumbnail_queue_size': (
+        GAUGE, 'Посты, ожидающие подготовки миниатюр'),
+}
+
+_lock = threading.Lock()
+_values = {}
+_flushed = 0.0
+
+
+def options():
+    return {
+        'ENABLED': True,
+        'DIR': os.path.join(settings.BASE_DIR, 'metrics'),
+        'FLUSH_INTERVAL': 5,
+        **getattr(settings, 'METRICS', {}),
+    }
+
+
+def enabled():
+    return options()['ENABLED']
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+def set_total(name, value, **labels):
+    """Счётчик, который процесс уже ведёт сам (например, статистика кеша)."""
+    with _lock:
+        _values[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        # Корзины без накопления, затем сумма и число наблюдений
+        histogram = _values.get(key)
+        if histogram is None:
+            histogram = _values[key] = [0] * (len(BUCKETS) + 2)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[index] += 1
+                break
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+
+_CACHE_RESULTS = {'hits': 'hit', 'misses': 'miss'}
+
+
+def _collect_cache_stats():
+    from django.core.cache import cache
+
+    if not hasattr(cache, 'stats'):
+        return
+    for name, value in cache.stats().items():
+        tier, _, result = name.partition('_')
+        if result in _CACHE_RESULTS:
+            set_total('yatube_cache_requests_total', value, tier=tier,
+                      result=_CACHE_RESULTS[result])
+
+
+def flush(force=False):
+    """Сбрасывает значения процесса в его файл, если пора."""
+    global _flushed
+    config = options()
+    now = time.monotonic()
+    if not force and now - _flushed < config['FLUSH_INTERVAL']:
+        return
+    _flushed = now
+    _collect_cache_stats()
+    with _lock:
+        rows = [[name, dict(labels), value]
+                for (name, labels), value in _values.items()]
+    os.makedirs(config['DIR'], exist_ok=True)
+    path = os.path.join(config['DIR'], f'{os.getpid()}.json')
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(rows, file)
+    os.replace(temporary, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_all(directory):
+    totals = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return totals
+    for filename in names:
+        pid, extension = os.path.splitext(filename)
+        if extension != '.json' or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(directory, filename),
+                      encoding='utf-8') as file:
+                rows = json.load(file)
+        except (OSError, ValueError):
+            continue
+        alive = None
+        for name, labels, value in rows:
+            kind = METRICS.get(name, (COUNTER,))[0]
+            if kind == GAUGE:
+                if alive is None:
+                    alive = _alive(int(pid))
+                if not alive:
+                    continue
+            key = _key(name, labels)
+            if kind == HISTOGRAM:
+                current = totals.setdefault(key, [0] * len(value))
+                totals[key] = [a + b for a, b in zip(current, value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _labels(labels, **extra):
+    pairs = (*labels, *extra.items())
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="{str(value).translate(_ESCAPES)}"' for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+_ESCAPES = str.maketrans({'\\': r'\\', '"': r'\"', '\n': r'\n'})
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Текст для /metrics по файлам всех процессов."""
+    flush(force=True)
+    totals = _read_all(options()['DIR'])
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted(
+            (labels, value) for (metric, labels), value in totals.items()
+            if metric == name)
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind != HISTOGRAM:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, hits in zip(BUCKETS, value):
+                cumulative += hits
+                lines.append(
+                    f'{name}_bucket{_labels(labels, le=_number(bound))} '
+                    f'{cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    global _flushed
+    with _lock:
+        _values.clear()
+    _flushed = 0.0
+
+
+def _final_flush():
+    # Процессы, которые не обслуживали запросы (migrate и т. п.), молчат
+    if not _values:
+        return
+    try:
+        flush(force=True)
+    except OSError:
+        pass
+
+
+# Воркер после fork не должен отчитываться за родителя
+os.register_at_fork(after_in_child=reset)
+atexit.register(_final_flush)
@@ -0,0 +1,261 @@
+import time
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import parse_http_date_safe
+
+from . import metrics, profiling, routers, static
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет чтение за основной базой после записи клиента.
+
+    Запрос, который что-то записал, ставит короткоживущую cookie; пока
+    она есть, чтения этого клиента не уходят на реплики. Небезопасные
+    методы читают из основной базы всегда.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pinned(self, request):
+        return (request.method not in SAFE_METHODS
+                or settings.REPLICA_PIN_COOKIE in request.COOKIES)
+
+    def _finish(self, response, writes):
+        if writes.wrote and routers.replicas():
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routers.track_writes() as writes, routers.pin_primary(
+                self._pinned(request)):
+            return self._finish(self.get_response(request), writes)
+
+    async def __acall__(self, request):
+        with routers.track_writes() as writes, routers.pin_primary(
+                self._pinned(request)):
+            return self._finish(await self.get_response(request), writes)
+
+
+def _route(request):
+    match = request.resolver_match
+    return match.view_name if match else 'unresolved'
+
+
+class ProfilingMiddleware:
+    """Профиль запроса в Server-Timing и в агрегаты по маршрутам.
+
+    Должен стоять первым, чтобы время включало остальные middleware.
+    Server-Timing раскрывает число запросов к базе и тайминги, поэтому
+    уходит только персоналу или при DEBUG.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _shows_timing(request):
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+    def _finish(self, request, response, profile, total, shows_timing):
+        profiling.registry.record(_route(request), profile, total)
+        if shows_timing:
+            response.headers['Server-Timing'] = profiling.server_timing(
+                profile, total)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not profiling.sample():
+            return self.get_response(request)
+        profile, token = profiling.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.finish(token)
+        total = time.perf_counter() - profile.started
+        return self._finish(request, response, profile, total,
+                            self._shows_timing(request))
+
+    async def __acall__(self, request):
+        if not profiling.sample():
+            return await self.get_response(request)
+        profile, token = profiling.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.finish(token)
+        total = time.perf_counter() - profile.started
+        # request.user ленивый и может пойти в базу
+        shows_timing = await sync_to_async(self._shows_timing)(request)
+        return self._finish(request, response, profile, total, shows_timing)
+
+
+_END = object()
+
+
+def _profiled(content, profile):
+    # Потоковый ответ рендерится уже после выхода из middleware: запросы
+    # к базе во время отдачи кусков записываются в тот же профиль
+    iterator = iter(content)
+    while True:
+        token = profiling.resume(profile)
+        try:
+            chunk = next(iterator, _END)
+        finally:
+            profiling.finish(token)
+        if chunk is _END:
+            return
+        yield chunk
+
+
+class MetricsMiddleware:
+    """Счётчики и гистограммы по представлениям для /metrics.
+
+    Ставится сразу после ProfilingMiddleware: если запрос не попал в
+    выборку профилирования, заводит облегчённый профиль сама, чтобы
+    посчитать запросы к базе. Потоковый ответ учитывается при close(),
+    когда он отдан целиком.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        profile = profiling.current()
+        if profile is not None:
+            return profile, None
+        return profiling.start(detailed=False)
+
+    def _record(self, request, response, profile, started):
+        view = _route(request)
+        metrics.inc('yatube_http_requests_total', view=view,
+                    method=request.method, status=response.status_code)
+        metrics.observe('yatube_http_request_duration_seconds',
+                        time.perf_counter() - started, view=view)
+        metrics.inc('yatube_db_queries_total', profile.sql_count, view=view)
+        metrics.inc('yatube_db_query_seconds_total', profile.sql_time,
+                    view=view)
+        metrics.flush()
+
+    def _finish(self, request, response, profile, started):
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = _profiled(
+                response.streaming_content, profile)
+            response._resource_closers.append(
+                lambda: self._record(request, response, profile, started))
+        else:
+            self._record(request, response, profile, started)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.enabled():
+            return self.get_response(request)
+        started = time.perf_counter()
+        profile, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                profiling.finish(token)
+        return self._finish(request, response, profile, started)
+
+    async def __acall__(self, request):
+        if not metrics.enabled():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        profile, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                profiling.finish(token)
+        return self._finish(request, response, profile, started)
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную статику из STATIC_ROOT в обход остальной цепочки.
+
+    Выбирает сжатый вариант по Accept-Encoding; файлы с хешем в имени
+    кешируются браузером навсегда (immutable).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _serve(self, request):
+        path = request.path_info
+        if (request.method not in ('GET', 'HEAD')
+                or not path.startswith(self.prefix)):
+            return None
+        static_file = static.lookup(path[len(self.prefix):])
+        if static_file is None:
+            return None
+        modified_since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since', ''))
+        if modified_since is not None and (
+                static_file.mtime <= modified_since):
+            response = HttpResponseNotModified()
+        else:
+            filename, encoding = static.choose(
+                static_file, request.headers.get('Accept-Encoding', ''))
+            response = FileResponse(open(filename, 'rb'),
+                                    content_type=static_file.content_type)
+            response.headers.pop('Content-Disposition', None)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        if static_file.variants:
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Last-Modified'] = static_file.last_modified
+        response.headers['Cache-Control'] = (
+            f'public, max-age={static.IMMUTABLE_MAX_AGE}, immutable'
+            if static_file.immutable
+            else f'public, max-age={static.MUTABLE_MAX_AGE}')
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self._serve(request) or await self.get_response(request)
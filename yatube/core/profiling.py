@@ -0,0 +1,245 @@
+"""Профилирование запросов: время, SQL, шаблоны и кеш.
+
+ProfilingMiddleware заводит профиль на запрос (в contextvar, поэтому
+он виден и из потоков sync_to_async), а обёртка соединений, шаблонный
+бэкенд и TwoTierCache пишут в него, если он есть. Итог уходит в
+заголовок Server-Timing и в агрегаты по имени маршрута: скользящие
+гистограммы времени и список самых медленных запросов SQL.
+
+Агрегаты живут в памяти процесса. С PROFILING['SAMPLE_RATE'] < 1
+профилируется только часть запросов; для остальных вся работа
+сводится к одному random().
+"""
+import contextvars
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+# Границы корзин гистограммы, мс
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+           float('inf'))
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def options():
+    return {
+        'ENABLED': True,
+        'SAMPLE_RATE': 0.0,
+        # Окно гистограмм: WINDOW отрезков по SLICE секунд
+        'SLICE': 60,
+        'WINDOW': 10,
+        'SLOW_QUERIES': 20,
+        **getattr(settings, 'PROFILING', {}),
+    }
+
+
+class RequestProfile:
+    __slots__ = ('started', 'sql_count', 'sql_time', 'template_time',
+                 'cache_hits', 'cache_misses', 'queries')
+
+    def __init__(self, detailed=True):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Тексты запросов нужны только для агрегатов профилирования
+        self.queries = [] if detailed else None
+
+
+def current():
+    return _current.get()
+
+
+def start(detailed=True):
+    profile = RequestProfile(detailed)
+    return profile, _current.set(profile)
+
+
+def resume(profile):
+    """Снова делает profile текущим, например на время отдачи потока."""
+    return _current.set(profile)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def sample():
+    config = options()
+    return config['ENABLED'] and random.random() < config['SAMPLE_RATE']
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Обёртка execute_wrapper, которая ставится на каждое соединение."""
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        profile.sql_count += 1
+        profile.sql_time += elapsed
+        if profile.queries is not None:
+            profile.queries.append((sql, elapsed))
+
+
+def install_sql_wrapper(connection, **kwargs):
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+def count_cache(hits, misses):
+    profile = _current.get()
+    if profile is not None:
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+
+
+def server_timing(profile, total):
+    return ', '.join((
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={profile.sql_time * 1000:.1f};'
+        f'desc="{profile.sql_count} queries"',
+        f'tpl;dur={profile.template_time * 1000:.1f}',
+        f'cache;desc="hit={profile.cache_hits} miss={profile.cache_misses}"',
+    ))
+
+
+class RollingHistogram:
+    """Гистограмма за последние WINDOW отрезков по SLICE секунд."""
+
+    def __init__(self, slice_seconds, window):
+        self.slice_seconds = slice_seconds
+        self.slices = deque(maxlen=window)
+
+    def _slice(self, now):
+        number = int(now // self.slice_seconds)
+        if not self.slices or self.slices[-1]['number'] != number:
+            self.slices.append({
+                'number': number,
+                'buckets': [0] * len(BUCKETS),
+                'count': 0,
+                'total': 0.0,
+                'sql_count': 0,
+                'sql_time': 0.0,
+            })
+        return self.slices[-1]
+
+    def add(self, ms, sql_count, sql_time, now):
+        current = self._slice(now)
+        for index, bound in enumerate(BUCKETS):
+            if ms <= bound:
+                current['buckets'][index] += 1
+                break
+        current['count'] += 1
+        current['total'] += ms
+        current['sql_count'] += sql_count
+        current['sql_time'] += sql_time * 1000
+
+    def summary(self, now):
+        oldest = int(now // self.slice_seconds) - self.slices.maxlen
+        live = [item for item in self.slices if item['number'] > oldest]
+        count = sum(item['count'] for item in live)
+        if not count:
+            return None
+        buckets = [sum(item['buckets'][index] for item in live)
+                   for index in range(len(BUCKETS))]
+        return {
+            'count': count,
+            'mean_ms': sum(item['total'] for item in live) / count,
+            'p50_ms': _quantile(buckets, count, 0.50),
+            'p95_ms': _quantile(buckets, count, 0.95),
+            'p99_ms': _quantile(buckets, count, 0.99),
+            'sql_per_request': sum(item['sql_count'] for item in live) / count,
+            'sql_ms_per_request': sum(
+                item['sql_time'] for item in live) / count,
+            'buckets': buckets,
+        }
+
+
+def _quantile(buckets, count, q):
+    """Верхняя граница корзины, в которую попадает квантиль."""
+    rank = q * count
+    seen = 0
+    for bound, hits in zip(BUCKETS, buckets):
+        seen += hits
+        if seen >= rank:
+            return bound
+    return BUCKETS[-1]
+
+
+_NUMBERS = re.compile(r"\b\d+\b|'[^']*'")
+
+
+def normalize_sql(sql):
+    # Запросы, отличающиеся только литералами, считаются одним
+    return _NUMBERS.sub('?', ' '.join(sql.split()))
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.queries = {}
+
+    def record(self, route, profile, total):
+        config = options()
+        now = time.time()
+        with self.lock:
+            histogram = self.routes.get(route)
+            if histogram is None:
+                histogram = self.routes[route] = RollingHistogram(
+                    config['SLICE'], config['WINDOW'])
+            histogram.add(total * 1000, profile.sql_count,
+                          profile.sql_time, now)
+            for sql, elapsed in profile.queries:
+                key = normalize_sql(sql)
+                stats = self.queries.get(key)
+                if stats is None:
+                    stats = self.queries[key] = {
+                        'sql': key, 'count': 0, 'total_ms': 0.0,
+                        'max_ms': 0.0, 'route': route}
+                stats['count'] += 1
+                stats['total_ms'] += elapsed * 1000
+                stats['max_ms'] = max(stats['max_ms'], elapsed * 1000)
+            self._trim(config['SLOW_QUERIES'] * 10)
+
+    def _trim(self, limit):
+        if len(self.queries) <= limit:
+            return
+        keep = sorted(self.queries.values(), key=lambda item: item['total_ms'],
+                      reverse=True)[:limit // 2]
+        self.queries = {item['sql']: item for item in keep}
+
+    def routes_summary(self):
+        now = time.time()
+        with self.lock:
+            rows = [
+                {'route': route, **summary}
+                for route, histogram in self.routes.items()
+                if (summary := histogram.summary(now)) is not None
+            ]
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+    def slow_queries(self):
+        with self.lock:
+            rows = [dict(item) for item in self.queries.values()]
+        rows.sort(key=lambda item: item['total_ms'], reverse=True)
+        return rows[:options()['SLOW_QUERIES']]
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+            self.queries.clear()
+
+
+registry = Registry()
@@ -0,0 +1,34 @@
+"""Замена настоящей репликации для локального запуска с репликами.
+
+Реплика — отдельный файл SQLite, который целиком перезаписывается
+копией основной базы через backup API. Между копиями реплика
+отстаёт, как настоящая асинхронная реплика.
+"""
+import sqlite3
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .routers import replicas
+from .signals import replicated
+
+
+def copy_database(source, target_path):
+    """Копирует базу из соединения Django source в файл target_path."""
+    source.ensure_connection()
+    target = sqlite3.connect(target_path)
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
+
+
+def replicate(aliases=None):
+    """Переносит текущее состояние default во все реплики."""
+    source = connections[DEFAULT_DB_ALIAS]
+    aliases = aliases or replicas()
+    for alias in aliases:
+        target = connections[alias]
+        if target.settings_dict['NAME'] == source.settings_dict['NAME']:
+            continue
+        copy_database(source, target.settings_dict['NAME'])
+    replicated.send(sender=None, aliases=aliases)
@@ -0,0 +1,82 @@
+"""Маршрутизация запросов между основной базой и репликами.
+
+Запись всегда идёт в default, чтение — в одну из реплик из
+settings.DATABASE_REPLICAS. Пока контекст «закреплён» (запрос с
+записью или недавняя запись того же клиента, см.
+core.middleware.ReplicaPinMiddleware), чтение тоже идёт в default,
+чтобы пользователь сразу видел свой пост или комментарий, даже если
+реплика отстаёт. Сессии, пользователи и типы содержимого всегда
+читаются из default: иначе только что вошедший пользователь на
+отстающей реплике окажется разлогинен.
+"""
+import contextlib
+import contextvars
+import random
+import types
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Приложения, которые читаются только из основной базы
+PRIMARY_APPS = frozenset({'auth', 'contenttypes', 'sessions'})
+
+_pinned = contextvars.ContextVar('replica_pinned', default=False)
+# Состояние текущего запроса; вне track_writes() запись ничего не закрепляет
+_writes = contextvars.ContextVar('replica_writes', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+@contextlib.contextmanager
+def pin_primary(pinned=True):
+    """Внутри блока все чтения идут в основную базу."""
+    token = _pinned.set(pinned or _pinned.get())
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextlib.contextmanager
+def track_writes():
+    """Отслеживает запись в блоке: после неё чтения идут в основную базу."""
+    writes = types.SimpleNamespace(wrote=False)
+    token = _writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _writes.reset(token)
+
+
+def is_pinned():
+    writes = _writes.get()
+    return _pinned.get() or (writes is not None and writes.wrote)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (is_pinned() or not replicas()
+                or model._meta.app_label in PRIMARY_APPS):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None:
+            writes.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними допустимы
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема приходит на реплики вместе с данными
+        if db in replicas():
+            return False
+        return None
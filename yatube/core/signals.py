@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Реплики получили свежую копию основной базы
+replicated = Signal()
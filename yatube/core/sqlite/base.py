@@ -0,0 +1,67 @@
+"""SQLite-бэкенд с настройками для конкурентной нагрузки.
+
+Каждое новое соединение получает PRAGMA из OPTIONS['pragmas']: WAL
+позволяет читателям не ждать писателя, а busy_timeout заставляет
+писателей ждать друг друга вместо ошибки «database is locked».
+
+Транзакции основной базы открываются как BEGIN IMMEDIATE: обычный
+BEGIN берёт блокировку записи только на первом INSERT/UPDATE, и если
+другой писатель успел зафиксировать изменения, SQLite сразу отвечает
+SQLITE_BUSY, не дожидаясь busy_timeout. IMMEDIATE держит блокировку
+записи всю транзакцию, поэтому блоки, которые только читают,
+оборачиваются в read_only(), а реплики (settings.DATABASE_REPLICAS)
+по умолчанию открывают обычный BEGIN. Режим задаёт и
+OPTIONS['transaction_mode'] ('' — обычный BEGIN).
+"""
+import contextlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, только последние
+    # транзакции при отключении питания
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+@contextlib.contextmanager
+def read_only(using=None):
+    """atomic() для блока без записи: обычный BEGIN, писатели не ждут."""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    saved = connection.__dict__.get('read_only', False)
+    connection.read_only = True
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        connection.read_only = saved
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    read_only = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        # Реплики только читают, блокировка записи им не нужна
+        default = ('' if self.alias in getattr(
+            settings, 'DATABASE_REPLICAS', ()) else 'IMMEDIATE')
+        self.transaction_mode = params.pop('transaction_mode', default)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = '' if self.read_only else self.transaction_mode
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,94 @@
+"""Защита от лавины пересчётов при промахе кеша.
+
+get_or_compute пересчитывает значение только в одном воркере за раз
+(блокировка через cache.add), остальные в это время отдают прошлое
+значение из stale_key. Пока запись не истекла, её можно обновить
+заранее с вероятностью, растущей к концу срока (алгоритм XFetch):
+пересчёт размазывается по времени, а не случается у всех в одну
+секунду.
+"""
+import math
+import random
+import time
+
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+LOCK_SUFFIX = ':lock'
+POLL_INTERVAL = 0.05
+
+
+def _lock_cache(cache):
+    # Блокировки живут секунды и нужны всем воркерам: LRU процесса
+    # им не нужен, а удаление через него сбрасывало бы чужие LRU
+    return getattr(cache, 'shared', cache)
+
+
+def _entry(value):
+    # Под тем же ключом мог остаться голый фрагмент от тега {% cache %}
+    if isinstance(value, tuple) and len(value) == 3:
+        return value
+    return None
+
+
+def _expired_early(entry, beta):
+    _, delta, expires = entry
+    if expires is None:
+        return False
+    # 1 - random() лежит в (0, 1], логарифм от нуля невозможен
+    return time.time() - delta * beta * math.log(
+        1 - random.random()) >= expires
+
+
+def _compute(cache, key, compute, timeout, stale_key):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    if timeout is DEFAULT_TIMEOUT:
+        timeout = cache.default_timeout
+    expires = None if timeout is None else time.time() + timeout
+    entry = (value, delta, expires)
+    cache.set(key, entry, timeout)
+    if stale_key is not None:
+        cache.set(stale_key, entry, None)
+    return value
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, *, stale_key=None,
+                   beta=1.0, lock_timeout=10, wait=2.0, cache=None,
+                   on_stale=None):
+    """Значение из кеша или compute(), без одновременных пересчётов.
+
+    stale_key — ключ, под которым хранится последнее посчитанное
+    значение (например, для прошлой версии ленты); его отдают, пока
+    другой воркер считает новое, и вызывают on_stale(). Без него
+    остальные ждут до wait секунд и только потом считают сами.
+    """
+    cache = cache or default_cache
+    locks = _lock_cache(cache)
+    lock_key = key + LOCK_SUFFIX
+    entry = _entry(cache.get(key))
+    if entry is not None:
+        if not _expired_early(entry, beta):
+            return entry[0]
+        # Запись ещё действует: пересчитывает тот, кто взял блокировку
+        if not locks.add(lock_key, 1, lock_timeout):
+            return entry[0]
+    elif not locks.add(lock_key, 1, lock_timeout):
+        stale = _entry(cache.get(stale_key)) if stale_key else None
+        if stale is not None:
+            if on_stale is not None:
+                on_stale()
+            return stale[0]
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = _entry(cache.get(key))
+            if entry is not None:
+                return entry[0]
+        # Владелец блокировки не успел: считаем сами, но не ждём дальше
+        return _compute(cache, key, compute, timeout, stale_key)
+    try:
+        return _compute(cache, key, compute, timeout, stale_key)
+    finally:
+        locks.delete(lock_key)
@@ -0,0 +1,158 @@
+"""Сборка и раздача статики.
+
+collectstatic с CompressedManifestStaticFilesStorage кладёт в
+STATIC_ROOT копии с хешем содержимого в имени и рядом с текстовыми
+файлами — сжатые варианты .gz и .br (если установлен Brotli).
+StaticFilesMiddleware отдаёт их из индекса, построенного один раз на
+процесс: на запрос приходится поиск в словаре и открытие файла, а
+FileResponse передаётся серверу как есть, чтобы тот отправил его через
+wsgi.file_wrapper (sendfile), не читая в Python.
+"""
+import gzip
+import mimetypes
+import os
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                staticfiles_storage)
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Расширения, которые имеет смысл сжимать
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.ico', '.json', '.txt',
+                '.xml', '.html')
+# Сжатая копия сохраняется, только если она меньше хотя бы на 5 %
+MIN_RATIO = 0.95
+# Кеш браузера для имён с хешем и для исходных имён, секунды
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60
+
+# Порядок предпочтения, если клиент принимает оба
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _gzip(data):
+    # mtime=0: одинаковое содержимое даёт одинаковый архив
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _encoders():
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+    yield '.gz', _gzip
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Хешированные имена плюс сжатые копии рядом с файлами."""
+
+    def stored_name(self, name):
+        # До первого collectstatic манифеста нет: исходные имена
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = {*paths, *self.hashed_files.values()}
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE):
+                yield from self._compress(name)
+
+    def _compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        for suffix, compress in _encoders():
+            compressed = compress(data)
+            if len(compressed) >= len(data) * MIN_RATIO:
+                continue
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            yield name, name + suffix, True
+
+
+StaticFile = namedtuple(
+    'StaticFile', ('path', 'content_type', 'last_modified', 'mtime',
+                   'variants', 'immutable'))
+
+
+def _build_index(root):
+    hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    index = {}
+    for directory, _, filenames in os.walk(root):
+        available = set(filenames)
+        for filename in filenames:
+            if filename.endswith(('.gz', '.br')) and (
+                    filename[:-3] in available):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            content_type, _ = mimetypes.guess_type(filename)
+            mtime = int(os.stat(path).st_mtime)
+            index[name] = StaticFile(
+                path=path,
+                content_type=content_type or 'application/octet-stream',
+                last_modified=http_date(mtime),
+                mtime=mtime,
+                variants={
+                    encoding: path + suffix
+                    for encoding, suffix in ENCODINGS
+                    if filename + suffix in available
+                },
+                immutable=name in hashed,
+            )
+    return index
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def lookup(name):
+    """Файл из STATIC_ROOT по имени из URL; индекс строится один раз."""
+    root = settings.STATIC_ROOT
+    if not root:
+        return None
+    index = _indexes.get(root)
+    if index is None:
+        with _lock:
+            index = _indexes.get(root)
+            if index is None:
+                index = _indexes[root] = _build_index(root)
+    return index.get(name)
+
+
+def reset():
+    """Забывает индексы, например после collectstatic в том же процессе."""
+    _indexes.clear()
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip() in (
+                '0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose(static_file, accept_encoding):
+    """(путь, Content-Encoding) лучшего варианта для клиента."""
+    if static_file.variants:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, _ in ENCODINGS:
+            path = static_file.variants.get(encoding)
+            if path is not None and (encoding in accepted or '*' in accepted):
+                return path, encoding
+    return static_file.path, None
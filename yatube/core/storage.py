@@ -0,0 +1,70 @@
+"""Хранилище медиафайлов с адресацией по содержимому.
+
+Имя файла — SHA-256 его содержимого, посчитанный за тот же проход,
+которым загрузка пишется на диск. Одинаковые загрузки поэтому лежат в
+одном файле, а sorl-thumbnail, у которого ключ миниатюры строится из
+имени исходника, готовит их миниатюры один раз. Файлы раскладываются
+по подкаталогам из начала хеша (posts/ab/cd/abcd….jpg), чтобы каталоги
+оставались небольшими и быстро читались при листинге и бэкапе.
+
+Сколько объектов ссылается на файл, хранилище не знает и само ничего
+не удаляет: счётчик ссылок ведёт приложение (posts.models.StoredImage).
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Ширина подкаталогов в шестнадцатеричных символах хеша, по уровням
+FANOUT = (2, 2)
+# Расширение сохраняется для MIME-типа при раздаче, но не длиннее этого
+MAX_EXTENSION = 10
+
+
+def content_name(directory, digest, extension=''):
+    """Имя файла с хешем digest внутри directory."""
+    parts, start = [], 0
+    for width in FANOUT:
+        parts.append(digest[start:start + width])
+        start += width
+    return posixpath.join(directory, *parts, digest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором имя файла — хеш содержимого."""
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определит содержимое в _save, занятое имя — тот же файл
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()[:MAX_EXTENSION]
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temp_path = tempfile.mkstemp(dir=self.location,
+                                                 prefix='.upload-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+            name = content_name(directory, digest.hexdigest(), extension)
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path),
+                        self.directory_permissions_mode or 0o777,
+                        exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            # Поверх файла с тем же содержимым: атомарно и без окна, в
+            # котором файла нет
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
@@ -0,0 +1,158 @@
+"""Потоковый рендеринг шаблонов Django.
+
+Template.render() склеивает страницу целиком, прежде чем отдать хоть
+байт. stream() обходит скомпилированный шаблон сам — с наследованием
+({% extends %}/{% block %}), {% if %} и {% for %} на верхнем уровне
+блоков — и отдаёт готовые куски по мере рендеринга. Всё, что выше
+блоков FLUSH_BLOCKS (<head> со стилями и шапка), уходит клиенту до
+того, как ленте понадобится база; затем каждый проход цикла уходит
+отдельным куском. Остальные теги рендерятся как обычно, целиком.
+
+Статус и заголовки отправляются до рендеринга, поэтому всё, что может
+закончиться 404 или редиректом, представление проверяет заранее.
+"""
+from django.http import StreamingHttpResponse
+from django.template import loader
+from django.template.context import make_context
+from django.template.defaulttags import ForNode, IfNode
+from django.template.loader_tags import (BLOCK_CONTEXT_KEY, BlockContext,
+                                         BlockNode, ExtendsNode)
+from django.template.base import TextNode, VariableDoesNotExist
+
+from . import routers
+
+# Перед этими блоками накопленное отправляется клиенту
+FLUSH_BLOCKS = ('content',)
+
+_FLUSH = object()
+
+
+def _nodes(nodelist, context):
+    for node in nodelist:
+        if isinstance(node, ExtendsNode):
+            yield from _extends(node, context)
+        elif isinstance(node, BlockNode):
+            yield from _block(node, context)
+        elif isinstance(node, IfNode):
+            yield from _if(node, context)
+        elif isinstance(node, ForNode):
+            yield from _for(node, context)
+        else:
+            yield node.render_annotated(context)
+
+
+def _extends(node, context):
+    # То же, что ExtendsNode.render, но родитель обходится по кускам
+    parent = node.get_parent(context)
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+    for parent_node in parent.nodelist:
+        if not isinstance(parent_node, TextNode):
+            if not isinstance(parent_node, ExtendsNode):
+                block_context.add_blocks({
+                    block.name: block for block in
+                    parent.nodelist.get_nodes_by_type(BlockNode)})
+            break
+    with context.render_context.push_state(parent, isolated_context=False):
+        yield from _nodes(parent.nodelist, context)
+
+
+def _block(node, context):
+    # То же, что BlockNode.render
+    if node.name in FLUSH_BLOCKS:
+        yield _FLUSH
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    with context.push():
+        if block_context is None:
+            context['block'] = node
+            yield from _nodes(node.nodelist, context)
+            return
+        push = block = block_context.pop(node.name)
+        if block is None:
+            block = node
+        block = type(node)(block.name, block.nodelist)
+        block.context = context
+        context['block'] = block
+        yield from _nodes(block.nodelist, context)
+        if push is not None:
+            block_context.push(node.name, push)
+
+
+def _if(node, context):
+    for condition, nodelist in node.conditions_nodelists:
+        if condition is None:
+            match = True
+        else:
+            try:
+                match = condition.eval(context)
+            except VariableDoesNotExist:
+                match = None
+        if match:
+            yield from _nodes(nodelist, context)
+            return
+
+
+def _for(node, context):
+    if node.is_reversed or len(node.loopvars) > 1:
+        yield node.render_annotated(context)
+        return
+    parentloop = context['forloop'] if 'forloop' in context else {}
+    with context.push():
+        values = node.sequence.resolve(context, ignore_failures=True)
+        if values is None:
+            values = []
+        if not hasattr(values, '__len__'):
+            values = list(values)
+        if not values:
+            yield from _nodes(node.nodelist_empty, context)
+            return
+        count = len(values)
+        loop = context['forloop'] = {'parentloop': parentloop}
+        for index, item in enumerate(values):
+            loop.update(
+                counter0=index, counter=index + 1,
+                revcounter=count - index, revcounter0=count - index - 1,
+                first=index == 0, last=index == count - 1,
+            )
+            context[node.loopvars[0]] = item
+            yield from _nodes(node.nodelist_loop, context)
+            yield _FLUSH
+
+
+def _chunks(pieces):
+    buffer = []
+    for piece in pieces:
+        if piece is _FLUSH:
+            if buffer:
+                yield ''.join(buffer)
+                buffer = []
+        else:
+            buffer.append(piece)
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream(template_name, context=None, request=None):
+    """Куски HTML шаблона по мере рендеринга."""
+    template = loader.get_template(template_name).template
+    context = make_context(context, request,
+                           autoescape=template.engine.autoescape)
+    # Поток дочитывается после выхода из middleware: закрепление чтения
+    # за основной базой нужно унести с собой
+    pinned = routers.is_pinned()
+    with routers.pin_primary(pinned), \
+            context.render_context.push_state(template), \
+            context.bind_template(template):
+        context.template_name = template.name
+        yield from _chunks(_nodes(template.nodelist, context))
+
+
+def render(request, template_name, context=None, status=None):
+    """Аналог shortcuts.render с потоковым ответом."""
+    return StreamingHttpResponse(
+        stream(template_name, context, request),
+        content_type='text/html; charset=utf-8',
+        status=status,
+    )
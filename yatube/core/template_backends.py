@@ -0,0 +1,29 @@
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import profiling
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = profiling.current()
+        if profile is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - started
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который засекает время рендеринга для профиля."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(
+            super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(
+            super().get_template(template_name).template, self)
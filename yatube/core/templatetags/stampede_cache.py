@@ -0,0 +1,72 @@
+from django import template
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+
+from core.stampede import get_or_compute
+
+register = template.Library()
+
+
+class StampedeCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on,
+                 version):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        expire_time = self.expire_time.resolve(context)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        # Ключ без версии хранит последний собранный фрагмент: его
+        # отдают, пока один воркер собирает фрагмент новой версии
+        stale_key = make_template_fragment_key(
+            self.fragment_name, vary_on) + ':stale'
+        if self.version is not None:
+            vary_on.append(self.version.resolve(context))
+        return get_or_compute(
+            make_template_fragment_key(self.fragment_name, vary_on),
+            lambda: self.nodelist.render(context),
+            expire_time,
+            stale_key=stale_key,
+            cache=caches['default'],
+            on_stale=lambda: self._mark_stale(context),
+        )
+
+    @staticmethod
+    def _mark_stale(context):
+        # Устаревшую страницу нельзя отдавать с ETag новой версии,
+        # иначе клиент получал бы на неё 304 до следующего изменения
+        request = getattr(context, 'request', None)
+        if request is not None:
+            request.served_stale = True
+
+
+@register.tag
+def swr_cache(parser, token):
+    """Как {% cache %}, но с защитой от одновременной пересборки.
+
+    {% swr_cache [expire_time] [fragment_name] [var1] .. version=var %}
+
+    Фрагмент собирает один воркер; остальные в это время получают
+    фрагмент прошлой версии с теми же var1..varN.
+    """
+    nodelist = parser.parse(('endswr_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 2 arguments.')
+    version = None
+    if tokens[-1].startswith('version='):
+        version = parser.compile_filter(tokens.pop()[len('version='):])
+    return StampedeCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(bit) for bit in tokens[3:]],
+        version,
+    )
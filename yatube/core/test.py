@@ -1,4 +1,35 @@
-from django.test import TestCase
+import copy
+import gzip
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from unittest import skipIf
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+
+from core import metrics, profiling, routers, stampede, static, streaming
+from core.cache_backends import SQLiteCache, TwoTierCache
+from core.middleware import ReplicaPinMiddleware
+from core.replication import copy_database
+from core.storage import ContentAddressedStorage
+from core.signals import replicated
+from core.sqlite.base import DatabaseWrapper
+from posts.models import Post, User
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +37,646 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class SQLiteConcurrencyTest(SimpleTestCase):
+    """Нагрузка на файловую базу: читатели не ждут писателей."""
+
+    WRITERS = 4
+    WRITES = 50
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.settings_dict = copy.deepcopy(connection.settings_dict)
+        self.settings_dict['NAME'] = os.path.join(directory, 'stress.sqlite3')
+        db = self._connect()
+        with db.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, n INT)')
+        db.close()
+
+    def _connect(self):
+        # Соединение Django привязано к потоку, где создана обёртка
+        return DatabaseWrapper(copy.deepcopy(self.settings_dict), 'stress')
+
+    def _count(self, db):
+        with db.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM item')
+            return cursor.fetchone()[0]
+
+    def _insert(self, db, n):
+        db.ensure_connection()
+        db._start_transaction_under_autocommit()
+        with db.cursor() as cursor:
+            cursor.execute('INSERT INTO item (n) VALUES (%s)', [n])
+            cursor.execute('COMMIT')
+
+    def test_pragmas_applied(self):
+        db = self._connect()
+        with db.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            # 1 — NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+        db.close()
+
+    def test_reader_not_blocked_by_open_write(self):
+        locked, released = threading.Event(), threading.Event()
+
+        def writer():
+            db = self._connect()
+            db.ensure_connection()
+            with db.cursor() as cursor:
+                # Крошечный кеш вынуждает сбрасывать страницы на диск
+                # посреди транзакции: без WAL это эксклюзивная блокировка
+                cursor.execute('PRAGMA cache_size = 10')
+            db._start_transaction_under_autocommit()
+            with db.cursor() as cursor:
+                cursor.executemany('INSERT INTO item (n) VALUES (%s)',
+                                   [[n] for n in range(5000)])
+                locked.set()
+                released.wait(5)
+                cursor.execute('COMMIT')
+            db.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            db = self._connect()
+            started = time.monotonic()
+            # Читатель видит снимок до незафиксированной записи
+            self.assertEqual(self._count(db), 0)
+            self.assertLess(time.monotonic() - started, 0.5)
+            db.close()
+        finally:
+            released.set()
+            thread.join()
+
+    def test_read_only_transaction_does_not_block_writer(self):
+        reader = self._connect()
+        reader.ensure_connection()
+        reader.read_only = True
+        reader._start_transaction_under_autocommit()
+        self.assertEqual(self._count(reader), 0)
+        writer = self._connect()
+        started = time.monotonic()
+        self._insert(writer, 1)
+        self.assertLess(time.monotonic() - started, 0.5)
+        with reader.cursor() as cursor:
+            cursor.execute('COMMIT')
+        reader.close()
+        writer.close()
+
+    @override_settings(DATABASE_REPLICAS=['stress'])
+    def test_replica_opens_deferred_transactions(self):
+        db = self._connect()
+        db.ensure_connection()
+        self.assertEqual(db.transaction_mode, '')
+        db.close()
+
+    def test_concurrent_writers_and_readers(self):
+        errors, read_times = [], []
+
+        def writer():
+            db = self._connect()
+            try:
+                for n in range(self.WRITES):
+                    self._insert(db, n)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                db.close()
+
+        def reader():
+            db = self._connect()
+            try:
+                for _ in range(self.WRITES):
+                    started = time.monotonic()
+                    self._count(db)
+                    read_times.append(time.monotonic() - started)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=writer)
+                   for _ in range(self.WRITERS)]
+        threads += [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        db = self._connect()
+        self.assertEqual(self._count(db), self.WRITERS * self.WRITES)
+        db.close()
+        self.assertLess(max(read_times), 0.5)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def _route(self, request, write=False):
+        """Прогоняет запрос через middleware и возвращает базу для чтения."""
+        routes = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Post)
+            routes.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(view)(request)
+        return routes[0], response
+
+    def test_reads_go_to_replica(self):
+        route, response = self._route(self.factory.get('/'))
+        self.assertEqual(route, 'replica')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_sessions_and_users_read_from_primary(self):
+        for model in (Session, User, ContentType):
+            self.assertEqual(self.router.db_for_read(model), 'default')
+
+    def test_writes_go_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+
+    def test_write_pins_following_reads(self):
+        route, response = self._route(self.factory.post('/'), write=True)
+        self.assertEqual(route, 'default')
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = cookie.value
+        route, _ = self._route(request)
+        self.assertEqual(route, 'default')
+
+    def test_write_in_get_pins_rest_of_request(self):
+        route, response = self._route(self.factory.get('/'), write=True)
+        self.assertEqual(route, 'default')
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_replica_fragments_keyed_separately(self):
+        from posts import caching
+
+        replica = caching.feed_version(caching.INDEX)
+        with routers.pin_primary():
+            primary = caching.feed_version(caching.INDEX)
+        self.assertNotEqual(replica, primary)
+        replicated.send(sender=None, aliases=['replica'])
+        self.assertNotEqual(caching.feed_version(caching.INDEX), replica)
+        with routers.pin_primary():
+            self.assertEqual(caching.feed_version(caching.INDEX), primary)
+
+    def test_replication_copies_primary(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = copy.deepcopy(connection.settings_dict)
+        settings_dict['NAME'] = os.path.join(directory, 'primary.sqlite3')
+        primary = DatabaseWrapper(settings_dict, 'primary')
+        with primary.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+            cursor.execute('INSERT INTO item DEFAULT VALUES')
+        replica_path = os.path.join(directory, 'replica.sqlite3')
+        copy_database(primary, replica_path)
+        primary.close()
+        replica = DatabaseWrapper(
+            {**settings_dict, 'NAME': replica_path}, 'replica')
+        with replica.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM item')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        replica.close()
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(CACHES={
+            **settings.CACHES,
+            'test_shared': {
+                'BACKEND': 'core.cache_backends.SQLiteCache',
+                'LOCATION': os.path.join(directory, 'shared.sqlite3'),
+            },
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.shared = caches['test_shared']
+
+    def _worker(self, name, **options):
+        """Кеш отдельного «воркера»: свой LRU, общий второй уровень."""
+        return TwoTierCache(f'{self.id()}-{name}', {'OPTIONS': {
+            'SHARED': 'test_shared', 'SYNC_INTERVAL': 0, **options}})
+
+    def test_shared_tier_fills_local(self):
+        first, second = self._worker('a'), self._worker('b')
+        first.set('key', {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        stats = second.stats()
+        self.assertEqual(stats['shared_hits'], 1)
+        self.assertEqual(stats['local_hits'], 1)
+        self.assertIsNone(second.get('missing'))
+        self.assertEqual(second.stats()['shared_misses'], 1)
+
+    def test_overwrite_in_other_worker_invalidates_local(self):
+        first, second = self._worker('a'), self._worker('b')
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        self.assertEqual(second.get('key'), 'new')
+        first.add('counter', 1)
+        self.assertEqual(second.get('counter'), 1)
+        first.incr('counter')
+        self.assertEqual(second.get('counter'), 2)
+        first.delete('counter')
+        self.assertIsNone(second.get('counter'))
+
+    def test_expired_entry_replaced_by_add_invalidates_local(self):
+        first, second = self._worker('a'), self._worker('b')
+        self.shared.set('key', 'old', timeout=0.05)
+        self.assertEqual(second.get('key'), 'old')
+        time.sleep(0.06)
+        self.assertTrue(first.add('key', 'new'))
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_write_keeps_other_local_entries(self):
+        first, second = self._worker('a'), self._worker('b')
+        first.set_many({'key': 'value', 'counter': 1})
+        second.get_many(['key', 'counter'])
+        first.incr('counter')
+        first.set('other', 'x')
+        self.assertEqual(second.get('key'), 'value')
+        self.assertEqual(second.get('counter'), 2)
+        stats = second.stats()
+        self.assertEqual(stats['local_hits'], 1)
+        self.assertEqual(stats['shared_hits'], 3)
+
+    def test_changes_checked_at_interval(self):
+        first = self._worker('a')
+        second = self._worker('b', SYNC_INTERVAL=60)
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        # До следующей сверки журнала второй воркер читает свой LRU
+        self.assertEqual(second.get('key'), 'old')
+
+    def test_local_copy_expires_with_shared(self):
+        first, second = self._worker('a'), self._worker('b')
+        first.set('key', 'value', timeout=0.05)
+        self.assertEqual(second.get('key'), 'value')
+        time.sleep(0.06)
+        self.assertIsNone(first.get('key'))
+        self.assertIsNone(second.get('key'))
+
+    def test_lagging_worker_drops_local(self):
+        first, second = self._worker('a'), self._worker('b')
+        first.set('key', 'value')
+        self.assertEqual(second.get('key'), 'value')
+        first.set('key', 'new')
+        self.shared._db.execute('DELETE FROM changes')
+        # Журнал после прошлой сверки потерян: изменённым считается всё
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_local_tier_is_bounded(self):
+        cache = self._worker('a', LOCAL_MAX_ENTRIES=3)
+        for i in range(5):
+            cache.set(f'key{i}', i)
+        self.assertEqual(cache.stats()['local_entries'], 3)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+
+    def test_local_ttl(self):
+        cache = self._worker('a', LOCAL_TIMEOUT=0.05)
+        cache.set('key', 'value')
+        time.sleep(0.06)
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+
+    def test_cull_keeps_generations_and_evicts_soonest_expiry(self):
+        cache = SQLiteCache(self.shared._path, {'OPTIONS': {
+            'MAX_ENTRIES': 50, 'CULL_FREQUENCY': 2,
+            'KEEP_KEYS': ['feed-version:']}})
+        cache.set('feed-version:index', 1, None)
+        cache.set('fragment', 'forever', None)
+        for i in range(98):
+            cache.set(f'short{i}', i, 60 + i)
+        self.assertTrue(cache.has_key('feed-version:index'))
+        self.assertTrue(cache.has_key('fragment'))
+        self.assertFalse(cache.has_key('short0'))
+        self.assertTrue(cache.has_key('short97'))
+
+    def test_sqlite_cache_incr_and_expiry(self):
+        self.shared.set('n', 1)
+        self.assertEqual(self.shared.incr('n', 5), 6)
+        with self.assertRaises(ValueError):
+            self.shared.incr('absent')
+        self.shared.set('short', 'x', timeout=-1)
+        self.assertFalse(self.shared.has_key('short'))
+        self.assertTrue(self.shared.add('short', 'y'))
+        self.assertFalse(self.shared.add('short', 'z'))
+        self.assertEqual(self.shared.get_many(['n', 'short', 'absent']),
+                         {'n': 6, 'short': 'y'})
+
+
+class StampedeTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.key = f'stampede:{self.id()}'
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _slow(self, value):
+        def compute():
+            with self.lock:
+                self.calls += 1
+            time.sleep(0.1)
+            return value
+        return compute
+
+    def _concurrently(self, call, count=8):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(call()))
+                   for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_flight_serves_stale(self):
+        stale_key = self.key + ':stale'
+        stampede.get_or_compute(self.key + ':v1', self._slow('old'),
+                                stale_key=stale_key)
+        self.calls = 0
+        results = self._concurrently(lambda: stampede.get_or_compute(
+            self.key + ':v2', self._slow('new'), stale_key=stale_key))
+        self.assertEqual(self.calls, 1)
+        self.assertIn('new', results)
+        self.assertEqual(set(results), {'old', 'new'})
+
+    def test_single_flight_waits_without_stale(self):
+        results = self._concurrently(lambda: stampede.get_or_compute(
+            self.key, self._slow('value')))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['value'] * 8)
+
+    def test_early_refresh_near_expiry(self):
+        # Считали долго и почти истекли: обновление почти наверняка
+        self.cache.set(self.key, ('old', 100.0, time.time() + 0.01))
+        value = stampede.get_or_compute(self.key, lambda: 'new', 60)
+        self.assertEqual(value, 'new')
+        self.cache.set(self.key, ('fresh', 0.0, time.time() + 3600))
+        self.assertEqual(
+            stampede.get_or_compute(self.key, lambda: 'other', 60), 'fresh')
+
+    def test_template_tag_marks_stale_response(self):
+        template = Template(
+            '{% load stampede_cache %}'
+            '{% swr_cache None stampede_tag name version=version %}'
+            '{{ name }}-{{ version }}{% endswr_cache %}')
+        context = Context({'name': self.id(), 'version': 1})
+        self.assertEqual(template.render(context), f'{self.id()}-1')
+        request = RequestFactory().get('/')
+        context = Context({'name': self.id(), 'version': 2})
+        context.request = request
+        # Другой воркер уже собирает вторую версию
+        key = make_template_fragment_key(
+            'stampede_tag', [self.id(), 2]) + stampede.LOCK_SUFFIX
+        self.cache.shared.add(key, 1)
+        self.assertEqual(template.render(context), f'{self.id()}-1')
+        self.assertTrue(request.served_stale)
+
+
+@override_settings(PROFILING={'SAMPLE_RATE': 1})
+class ProfilingTest(TestCase):
+    def setUp(self):
+        profiling.registry.reset()
+
+    def test_server_timing_header(self):
+        self.client.force_login(
+            User.objects.create_user(username='timing', is_staff=True))
+        response = self.client.get('/')
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'tpl;dur=', 'cache;desc='):
+            self.assertIn(metric, timing)
+        self.assertNotIn('db;dur=0.0;desc="0 queries"', timing)
+
+    def test_server_timing_hidden_from_visitors(self):
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+        # Профиль всё равно попал в агрегаты /stats/
+        routes = {row['route'] for row in
+                  profiling.registry.routes_summary()}
+        self.assertIn('posts:index', routes)
+        with self.settings(DEBUG=True):
+            self.assertIn('Server-Timing', self.client.get('/'))
+
+    def test_routes_aggregated_by_url_name(self):
+        for _ in range(3):
+            self.client.get('/')
+        routes = {row['route']: row for row in
+                  profiling.registry.routes_summary()}
+        self.assertEqual(routes['posts:index']['count'], 3)
+        self.assertTrue(profiling.registry.slow_queries())
+
+    @override_settings(PROFILING={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_skipped(self):
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.registry.routes_summary(), [])
+
+    def test_stats_page_for_staff_only(self):
+        user = User.objects.create_user(username='profiler')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/stats/').status_code, 302)
+        user.is_staff = True
+        user.save()
+        self.client.get('/')
+        response = self.client.get('/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'posts:index')
+
+    def test_histogram_window(self):
+        histogram = profiling.RollingHistogram(slice_seconds=1, window=2)
+        histogram.add(3, 1, 0.001, now=0)
+        histogram.add(300, 5, 0.1, now=1)
+        summary = histogram.summary(now=1)
+        self.assertEqual(summary['count'], 2)
+        self.assertEqual(summary['p50_ms'], 5)
+        self.assertEqual(summary['p99_ms'], 500)
+        # Старый отрезок выпал из окна
+        self.assertEqual(histogram.summary(now=2)['count'], 1)
+
+
+def _child_metrics():
+    metrics.inc('yatube_http_requests_total', 5, view='posts:index',
+                method='GET', status=200)
+    metrics.inc('yatube_thumbnail_queue_size', 3)
+    metrics.flush(force=True)
+
+
+@override_settings(METRICS={**settings.METRICS, 'TOKEN': 's'})
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        shutil.rmtree(metrics.options()['DIR'], ignore_errors=True)
+
+    def scrape(self):
+        return self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer s').content.decode()
+
+    def test_view_counters_and_histograms(self):
+        self.client.get('/')
+        self.client.get('/')
+        text = self.scrape()
+        self.assertIn('yatube_http_requests_total{method="GET",status="200",'
+                      'view="posts:index"} 2', text)
+        self.assertIn('yatube_http_request_duration_seconds_bucket'
+                      '{view="posts:index",le="+Inf"} 2', text)
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', text)
+        self.assertIn('yatube_cache_requests_total{result="hit"', text)
+
+    def test_workers_aggregated_through_files(self):
+        metrics.inc('yatube_http_requests_total', view='posts:index',
+                    method='GET', status=200)
+        metrics.inc('yatube_thumbnail_queue_size', 2)
+        worker = multiprocessing.get_context('fork').Process(
+            target=_child_metrics)
+        worker.start()
+        worker.join()
+        text = metrics.render()
+        # Счётчик завершившегося воркера учитывается, его очередь — нет
+        self.assertIn('yatube_http_requests_total{method="GET",status="200",'
+                      'view="posts:index"} 6', text)
+        self.assertIn('yatube_thumbnail_queue_size 2\n', text)
+
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s')
+        self.assertEqual(response.status_code, 200)
+        with override_settings(METRICS={**settings.METRICS, 'TOKEN': None}):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @skipIf(settings.POSTS_ASYNC_VIEWS, 'потоковые ответы только у sync')
+    @override_settings(POSTS_STREAMING_VIEWS=True)
+    def test_streamed_response_counted_when_closed(self):
+        Post.objects.create(
+            author=User.objects.create_user(username='metrics_author'),
+            text='Пост в потоке')
+        response = self.client.get('/')
+        self.assertNotIn('view="posts:index"', metrics.render())
+        b''.join(response.streaming_content)
+        response.close()
+        text = metrics.render()
+        self.assertIn('yatube_http_requests_total{method="GET",status="200",'
+                      'view="posts:index"} 1', text)
+        queries = re.search(
+            r'yatube_db_queries_total\{view="posts:index"\} (\S+)', text)
+        # Посты ленты читаются уже во время отдачи потока
+        self.assertGreater(float(queries.group(1)), 0)
+
+
+class StaticFilesTest(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        override = override_settings(STATIC_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        static.reset()
+        self.addCleanup(static.reset)
+        self.source = os.path.join(
+            settings.BASE_DIR, 'static', 'css', 'bootstrap.min.css')
+        with open(self.source, 'rb') as file:
+            self.content = file.read()
+
+    def hashed_url(self):
+        template = Template("{% load static %}{% static 'css/bootstrap.min.css' %}")
+        return template.render(Context())
+
+    def test_hashed_copy_with_compressed_variant(self):
+        url = self.hashed_url()
+        self.assertRegex(url, r'^/static/css/bootstrap\.min\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            self.content)
+
+    def test_identity_without_accept_encoding(self):
+        response = self.client.get(self.hashed_url(),
+                                   HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_original_name_not_immutable(self):
+        response = self.client.get('/static/css/bootstrap.min.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_not_modified(self):
+        url = self.hashed_url()
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class StreamingTest(SimpleTestCase):
+    def stream(self, source, context):
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {'loaders': [(
+                'django.template.loaders.locmem.Loader',
+                {'page.html': source})]},
+        }]
+        with self.settings(TEMPLATES=templates):
+            chunks = list(streaming.stream('page.html', context))
+            expected = Template(source).render(Context(context))
+        self.assertEqual(''.join(chunks), expected)
+        return chunks
+
+    def test_same_html_in_chunks(self):
+        chunks = self.stream(
+            '<head></head>{% block content %}'
+            '{% for item in items %}{% if forloop.first %}!{% endif %}'
+            '{{ item }}:{{ forloop.counter }};{% empty %}-{% endfor %}'
+            '{% endblock %}',
+            {'items': ['a', 'b<', 'c']})
+        self.assertEqual(chunks,
+                         ['<head></head>', '!a:1;', 'b&lt;:2;', 'c:3;'])
+
+    def test_empty_loop(self):
+        self.assertEqual(
+            self.stream('{% for item in items %}{{ item }}'
+                        '{% empty %}пусто{% endfor %}', {'items': []}),
+            ['пусто'])
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.root)
+
+    def test_name_from_content(self):
+        first = self.storage.save('posts/a.JPG', ContentFile(b'data'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'data'))
+        other = self.storage.save('posts/a.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        with self.storage.open(first) as file:
+            self.assertEqual(file.read(), b'data')
+        # Во временных файлах загрузки ничего не осталось
+        self.assertEqual(os.listdir(self.root), ['posts'])
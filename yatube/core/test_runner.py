@@ -0,0 +1,41 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner as BaseRunner
+
+from core import metrics
+
+
+class DiscoverRunner(BaseRunner):
+    """Подменяет файлы SQLiteCache и каталог метрик временными.
+
+    Иначе тесты видели бы поколения лент и фрагменты рабочего кеша,
+    собранные по другой базе, и сами бы его засоряли.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp()
+        cache_settings = copy.deepcopy(settings.CACHES)
+        for alias, params in cache_settings.items():
+            if params['BACKEND'] == 'core.cache_backends.SQLiteCache':
+                params['LOCATION'] = os.path.join(
+                    self._cache_dir, f'{alias}.sqlite3')
+        metrics_settings = {
+            **getattr(settings, 'METRICS', {}),
+            'DIR': os.path.join(self._cache_dir, 'metrics'),
+        }
+        self._cache_override = override_settings(
+            CACHES=cache_settings, METRICS=metrics_settings)
+        self._cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_override.disable()
+        # Иначе atexit сбросил бы накопленное в рабочий каталог
+        metrics.reset()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,5 +1,11 @@
+import hmac
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 
+from . import metrics, profiling
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -7,3 +13,25 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def profiling_stats(request):
+    context = {
+        'routes': profiling.registry.routes_summary(),
+        'queries': profiling.registry.slow_queries(),
+        'options': profiling.options(),
+    }
+    return render(request, 'core/stats.html', context)
+
+
+def metrics_view(request):
+    # Без токена эндпоинт выключен, а не открыт всем
+    token = metrics.options().get('TOKEN')
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''),
+                               f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
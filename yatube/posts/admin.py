@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search, thumbnails
 from .models import Post, Group, Comment
 
 
@@ -10,6 +11,21 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу FTS5 вместо LIKE по всей таблице
+        if not search_term:
+            return queryset, False
+        return search.filter_queryset(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        # Как в post_create/post_edit: новая картинка — новые миниатюры
+        image_changed = 'image' in form.changed_data
+        if image_changed:
+            obj.thumbnails = {}
+        super().save_model(request, obj, form, change)
+        if image_changed and obj.image:
+            thumbnails.schedule(obj)
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
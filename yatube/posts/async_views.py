@@ -0,0 +1,132 @@
+"""Асинхронные версии страниц, которые только читают данные.
+
+Подключаются вместо views.* при POSTS_ASYNC_VIEWS = True (профиль
+yatube.settings_asgi). Запросы к базе идут через async-API ORM, а
+шаблоны рендерятся в потоке: контекст-процессоры и шапка обращаются
+к request.user и кешу синхронно.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.shortcuts import render
+
+from . import caching, etags, follow_graph, pull_feed, timeline
+from .forms import CommentForm
+from .models import Group, Post, User, UserStats
+from .timeline import ORDERING as TIMELINE_ORDERING
+from .utils import (COMMENT_ORDERING, COMMENTS_PER_PAGE, NUM_OF_PAGES,
+                    CursorPaginator, apage, cached_count)
+
+arender = sync_to_async(render)
+
+
+def _load_user(request):
+    # В Django 4.1 нет request.auser(): достаём пользователя из сессии
+    # в потоке, дальше SimpleLazyObject отдаёт его без запросов
+    request.user.is_authenticated
+    return request.user
+
+
+async def _get_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches '
+                      'the given query.')
+
+
+@etags.conditional(etags.index)
+async def index(request):
+    post_list = Post.objects.all()
+    context = {
+        'page_obj': await apage(request, post_list,
+                                count=cached_count(post_list, 'index')),
+        'feed_version': await caching.afeed_version(caching.INDEX),
+    }
+    return await arender(request, 'posts/index.html', context)
+
+
+@etags.conditional(etags.group_list)
+async def groups_posts(request, slug):
+    group = await _get_or_404(Group.objects, slug=slug)
+    context = {
+        'group': group,
+        'page_obj': await apage(
+            request, group.posts.all(),
+            count=cached_count(group.posts.all(), f'group:{group.pk}')),
+        'feed_version': await caching.afeed_version(
+            caching.group_scope(group.pk)),
+    }
+    return await arender(request, 'posts/group_list.html', context)
+
+
+@etags.conditional(etags.profile)
+async def profile(request, username):
+    author = await _get_or_404(User.objects, username=username)
+    user = await sync_to_async(_load_user)(request)
+    stats = await UserStats.objects.afor_user(author)
+    following = user.is_authenticated and await follow_graph.ais_following(
+        user.pk, author.pk)
+    context = {
+        'username': username,
+        'author': author,
+        'count_posts': stats.posts_count,
+        'stats': stats,
+        'page_obj': await apage(request, author.posts.all(),
+                                count=stats.posts_count),
+        'feed_version': await caching.afeed_version(
+            caching.author_scope(author.pk)),
+        'following': following,
+    }
+    return await arender(request, 'posts/profile.html', context)
+
+
+@etags.conditional(etags.post_detail)
+async def post_detail(request, post_id):
+    post = await _get_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    stats = await UserStats.objects.afor_user(post.author)
+    comments = await CursorPaginator(
+        post.comments.select_related('author'),
+        COMMENTS_PER_PAGE,
+        COMMENT_ORDERING,
+    ).aget_page()
+    context = {
+        'post': post,
+        'count_post': stats.posts_count,
+        'form': CommentForm(),
+        'comments': comments,
+    }
+    return await arender(request, 'posts/post_detail.html', context)
+
+
+@etags.conditional(etags.follow_index)
+async def follow_index(request):
+    # login_required в Django 4.1 не умеет оборачивать корутины
+    user = await sync_to_async(_load_user)(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if not timeline.enabled():
+        # Слияние списков идёт по синхронному кешу, целиком в потоке
+        context = {
+            'page_obj': await sync_to_async(pull_feed.get_page)(
+                user.pk,
+                NUM_OF_PAGES,
+                request.GET.get('after'),
+                request.GET.get('before'),
+                request.GET,
+            ),
+            'feed_version': await sync_to_async(pull_feed.version)(user.pk),
+        }
+        return await arender(request, 'posts/follow.html', context)
+    entries = user.timeline.select_related('post__author', 'post__group')
+    # Оценка считается при рендеринге, уже в потоке
+    page_obj = await apage(request, entries, TIMELINE_ORDERING, cached_count(
+        entries, f'follow:{user.pk}'))
+    page_obj.object_list = [entry.post for entry in page_obj]
+    context = {
+        'page_obj': page_obj,
+        'feed_version': await caching.afeed_version(
+            caching.follow_scope(user.pk)),
+    }
+    return await arender(request, 'posts/follow.html', context)
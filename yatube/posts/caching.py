@@ -0,0 +1,124 @@
+"""Версии лент для кеша фрагментов.
+
+Каждая лента (общая, группы, автора, подписок пользователя) имеет
+счётчик-поколение в кеше. Сигналы увеличивают его при изменении
+данных, а ключ фрагмента включает текущее поколение, поэтому
+фрагменты можно хранить бессрочно и они никогда не устаревают.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+
+# Поколение, общее для всех лент: сбрасывает всё разом
+GLOBAL = 'global'
+INDEX = 'index'
+# Поколение копий реплик: фрагменты, собранные по реплике, живут до
+# её следующего обновления
+REPLICA = 'replica'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def following_scope(user_id):
+    # Множество подписок пользователя (posts.follow_graph)
+    return f'following:{user_id}'
+
+
+def author_card_scope(author_id):
+    # Имя автора в карточках его постов; новые посты автора, в отличие
+    # от author_scope, его не сдвигают
+    return f'author-card:{author_id}'
+
+
+def group_card_scope(group_id):
+    # Адрес группы в карточках её постов
+    return f'group-card:{group_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def profile_scope(user_id):
+    # Счётчики подписок на странице профиля; фрагменты ленты автора
+    # от них не зависят, поэтому это отдельное поколение
+    return f'profile:{user_id}'
+
+
+def _key(scope):
+    return f'feed-version:{scope}'
+
+
+def _initial():
+    # Начальное значение из часов, чтобы после очистки кеша
+    # поколения не повторяли уже выданные
+    return time.time_ns()
+
+
+def _scopes(scopes):
+    # Фрагмент, собранный по отстающей реплике, не должен попасть
+    # к клиенту, который читает свои записи из основной базы
+    from .models import Post
+
+    if router.db_for_read(Post) == DEFAULT_DB_ALIAS:
+        return (GLOBAL, *scopes)
+    return (GLOBAL, *scopes, REPLICA)
+
+
+def scope_versions(*scopes):
+    """Поколения лент по отдельности, вместе с общими."""
+    keys = {_key(scope): scope for scope in _scopes(scopes)}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial(), None)
+            versions[key] = cache.get(key)
+    return {scope: versions[key] for key, scope in keys.items()}
+
+
+def feed_version(*scopes):
+    """Строка текущих поколений для ключа фрагмента ленты."""
+    return '.'.join(str(version)
+                    for version in scope_versions(*scopes).values())
+
+
+async def afeed_version(*scopes):
+    """Асинхронный вариант feed_version."""
+    keys = [_key(scope) for scope in _scopes(scopes)]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, _initial(), None)
+            versions[key] = await cache.aget(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump(*scopes):
+    """Переводит ленты на новое поколение."""
+    for scope in scopes:
+        key = _key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial(), None)
+
+
+def invalidate(*scopes):
+    """Сбрасывает ленты сейчас и ещё раз после фиксации транзакции.
+
+    Повторный сброс не даёт закешировать под новым поколением данные,
+    прочитанные параллельным запросом до коммита.
+    """
+    bump(*scopes)
+    transaction.on_commit(lambda: bump(*scopes))
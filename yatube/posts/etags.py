@@ -0,0 +1,125 @@
+"""Валидаторы для условных GET-запросов к лентам и постам.
+
+ETag строится из поколений posts.caching, поэтому проверка стоит
+одного похода в кеш (и, где нужно, поиска id по уникальному индексу):
+при совпадении страница отдаётся как 304 без выборки постов и без
+рендеринга шаблона. Страница зависит от того, кто её смотрит, так что
+в тег входит и id пользователя, а у страниц с формой — отпечаток
+csrf-секрета: после нового входа секрет другой, и закешированная
+браузером форма с прежним токеном не должна получить 304. Тег слабый:
+маска csrf-токена в формах меняется при каждом рендеринге.
+"""
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response, quote_etag
+from django.views.decorators.http import condition
+
+from . import caching, pull_feed, timeline
+from .models import Group, Post, User
+
+
+def _etag(request, *scopes, form=False):
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    tag = f'{caching.feed_version(*scopes)}-{user_id}'
+    if form:
+        secret = request.META.get('CSRF_COOKIE', '')
+        tag += '-' + hashlib.md5(secret.encode()).hexdigest()[:12]
+    return f'W/"{tag}"'
+
+
+def _lookup(model, *fields, **lookup):
+    rows = model.objects.filter(**lookup).values_list(*fields).order_by()
+    row = rows.first()
+    if len(fields) == 1 and row is not None:
+        return row[0]
+    return row
+
+
+def index(request):
+    return _etag(request, caching.INDEX)
+
+
+def group_list(request, slug):
+    group_id = _lookup(Group, 'pk', slug=slug)
+    if group_id is None:
+        return None
+    return _etag(request, caching.group_scope(group_id))
+
+
+def profile(request, username):
+    author_id = _lookup(User, 'pk', username=username)
+    if author_id is None:
+        return None
+    return _etag(request, caching.author_scope(author_id),
+                 caching.profile_scope(author_id))
+
+
+def post_detail(request, post_id):
+    # Счётчик постов автора на странице меняется вместе с его лентой,
+    # название группы — вместе с группой
+    row = _lookup(Post, 'author_id', 'group_id', pk=post_id)
+    if row is None:
+        return None
+    author_id, group_id = row
+    scopes = [caching.post_scope(post_id), caching.author_scope(author_id)]
+    if group_id is not None:
+        scopes.append(caching.group_scope(group_id))
+    # Залогиненным страница рисует форму комментария
+    return _etag(request, *scopes, form=request.user.is_authenticated)
+
+
+def follow_index(request):
+    if not request.user.is_authenticated:
+        # Аноним должен получить редирект на вход, а не 304
+        return None
+    if not timeline.enabled():
+        user_id = request.user.pk
+        return f'W/"{pull_feed.version(user_id)}-{user_id}"'
+    return _etag(request, caching.follow_scope(request.user.pk))
+
+
+def _drop_stale_etag(request, response):
+    # Тег {% swr_cache %} отдал фрагмент прошлой версии, пока другой
+    # воркер собирает новый: тег новой версии к такой странице не подходит
+    if getattr(request, 'served_stale', False):
+        response.headers.pop('ETag', None)
+    return response
+
+
+def conditional(etag_func):
+    """condition(etag_func=...) и для обычных, и для async-представлений.
+
+    В Django 4.1 condition() не умеет оборачивать корутины.
+    """
+    aetag_func = sync_to_async(etag_func)
+
+    def decorator(view):
+        if not asyncio.iscoroutinefunction(view):
+            conditional_view = condition(etag_func=etag_func)(view)
+
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                return _drop_stale_etag(
+                    request, conditional_view(request, *args, **kwargs))
+
+            return wrapper
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            etag = await aetag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+            return _drop_stale_etag(request, response)
+
+        return inner
+
+    return decorator
@@ -0,0 +1,72 @@
+"""Кешированные множества подписок пользователей.
+
+id авторов, на которых подписан пользователь, лежат в кеше одним
+отсортированным массивом array('q') — по 8 байт на подписку — под
+ключом с поколением caching.following_scope. Подписка и отписка
+переводят его на новое поколение (сейчас и после коммита, как ленты),
+поэтому устаревший массив не прочитать, а проверка «подписан ли» —
+двоичный поиск без запроса к базе. Массивы прошлых поколений больше
+никто не читает, поэтому они живут TIMEOUT секунд, а не вечно.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from . import caching
+from .models import Follow
+
+# Секунды жизни массива; активный пользователь перечитает его из базы
+# раз в это время
+TIMEOUT = 60 * 60
+
+
+def _key(user_id, version):
+    return f'followees:{user_id}:{version}'
+
+
+def _queryset(user_id):
+    return Follow.objects.filter(user_id=user_id).order_by(
+        'author_id').values_list('author_id', flat=True)
+
+
+def _unpack(packed):
+    ids = array('q')
+    ids.frombytes(packed)
+    return ids
+
+
+def followees(user_id):
+    """Отсортированный массив id авторов, на которых подписан пользователь."""
+    key = _key(user_id, caching.feed_version(caching.following_scope(user_id)))
+    packed = cache.get(key)
+    if packed is not None:
+        return _unpack(packed)
+    ids = array('q', _queryset(user_id))
+    cache.set(key, ids.tobytes(), TIMEOUT)
+    return ids
+
+
+async def afollowees(user_id):
+    """Асинхронный вариант followees."""
+    key = _key(user_id, await caching.afeed_version(
+        caching.following_scope(user_id)))
+    packed = await cache.aget(key)
+    if packed is not None:
+        return _unpack(packed)
+    ids = array('q', [pk async for pk in _queryset(user_id)])
+    await cache.aset(key, ids.tobytes(), TIMEOUT)
+    return ids
+
+
+def contains(ids, author_id):
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def is_following(user_id, author_id):
+    return contains(followees(user_id), author_id)
+
+
+async def ais_following(user_id, author_id):
+    return contains(await afollowees(user_id), author_id)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Готовит миниатюры постам, у которых их нет: старым, '
+            'импортированным и тем, чья задача не выполнилась')
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        for post_id, image in thumbnails.missing().values_list(
+                'pk', 'image').iterator():
+            # Повторы здесь не нужны: команду можно просто запустить снова
+            if thumbnails.generate(post_id, image,
+                                   attempt=thumbnails.ATTEMPTS):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры готовы: {done}, с ошибкой: {failed}'))
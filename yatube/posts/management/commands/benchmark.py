@@ -0,0 +1,312 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import QueryDict
+from django.test import Client, RequestFactory
+from django.utils import timezone
+
+from posts.models import Follow, Group, Post
+
+User = get_user_model()
+
+
+def percentile(quantiles, p):
+    return quantiles[p - 1] if quantiles else 0.0
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет все маршруты posts и users через WSGI- или '
+            'ASGI-приложение и сохраняет задержки, число запросов к БД '
+            'и пропускную способность в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на каждый маршрут')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--user', help='Пользователь для закрытых страниц')
+        parser.add_argument('--include-writes', action='store_true',
+                            help='Мерить и маршруты подписки/отписки')
+        parser.add_argument('--output', help='Файл для JSON с результатами')
+        parser.add_argument(
+            '--interface', choices=('wsgi', 'asgi'), default='wsgi',
+            help='asgi запускайте с --settings yatube.settings_asgi, чтобы '
+                 'работали async-представления; --concurrency задаёт число '
+                 'потоков WSGI или одновременных задач в цикле ASGI')
+        parser.add_argument(
+            '--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+            help='Сравнить пропускную способность двух сохранённых прогонов')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self.compare(*options['compare'])
+            return
+        user = self.pick_user(options['user'])
+        cookie = self.session_cookie(user)
+        routes = self.routes(user, options['include_writes'])
+        results = {}
+        self.counter = QueryCounter()
+        for name, path, auth in routes:
+            stats = self.measure(
+                path,
+                cookie if auth else '',
+                options['requests'],
+                options['warmup'],
+                options['concurrency'],
+                options['interface'],
+            )
+            results[name] = {'path': path, **stats}
+            self.stdout.write(
+                f'{name:<28} p50 {stats["p50_ms"]:8.2f} ms  '
+                f'p95 {stats["p95_ms"]:8.2f} ms  '
+                f'p99 {stats["p99_ms"]:8.2f} ms  '
+                f'{stats["queries_per_request"]:6.1f} q/req  '
+                f'{stats["throughput_rps"]:8.1f} req/s')
+        report = {
+            'started': timezone.now().isoformat(),
+            'interface': options['interface'],
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'data': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'routes': results,
+        }
+        # Счётчики попаданий по уровням, если кеш их ведёт
+        if hasattr(cache, 'stats'):
+            report['cache'] = cache.stats()
+            self.stdout.write(f'Кеш: {report["cache"]}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'))
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Нет пользователя {username}')
+        follow = Follow.objects.order_by('?').first()
+        user = follow.user if follow else User.objects.first()
+        if user is None:
+            raise CommandError('База пуста: сначала запустите seed_data')
+        return user
+
+    def session_cookie(self, user):
+        client = Client()
+        client.force_login(user)
+        return '; '.join(
+            f'{morsel.key}={morsel.value}' for morsel in client.cookies.values())
+
+    def routes(self, user, include_writes):
+        """(имя, путь, нужна ли авторизация) для каждого маршрута."""
+        post = Post.objects.filter(author=user).first() or Post.objects.first()
+        group = Group.objects.first()
+        author = (Follow.objects.filter(user=user).first() or Follow(
+            author=post.author if post else user)).author
+        routes = [
+            ('posts:index', '/', False),
+            ('posts:search', '/search/?q=пост', False),
+            ('posts:profile', f'/profile/{author.username}/', False),
+            ('posts:post_create', '/create/', True),
+            ('posts:follow_index', '/follow/', True),
+            ('users:signup', '/auth/signup/', False),
+            ('users:login', '/auth/login/', False),
+            ('users:logout', '/auth/logout/', False),
+            ('users:password_reset_form', '/auth/password_reset/', False),
+        ]
+        if group is not None:
+            routes.append(
+                ('posts:group_list', f'/group/{group.slug}/', False))
+        if post is not None:
+            routes += [
+                ('posts:post_detail', f'/posts/{post.pk}/', False),
+                ('posts:comments', f'/posts/{post.pk}/comments/', False),
+                ('posts:post_edit', f'/posts/{post.pk}/edit/', True),
+                ('posts:add_comment', f'/posts/{post.pk}/comment/', True),
+            ]
+        if include_writes and author != user:
+            routes += [
+                ('posts:profile_follow',
+                 f'/profile/{author.username}/follow/', True),
+                ('posts:profile_unfollow',
+                 f'/profile/{author.username}/unfollow/', True),
+            ]
+        return routes
+
+    def measure(self, path, cookie, requests, warmup, concurrency,
+                interface):
+        path, _, query = path.partition('?')
+        if interface == 'asgi':
+            call = self.asgi_caller(path, query, cookie)
+        else:
+            call = self.wsgi_caller(path, query, cookie)
+        for _ in range(warmup):
+            call()
+        with self.counter as counter:
+            started = time.perf_counter()
+            if interface == 'asgi':
+                samples = asyncio.run(
+                    self.run_async(call.coroutine, requests, concurrency))
+            else:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    samples = list(
+                        executor.map(lambda _: call(), range(requests)))
+            elapsed = time.perf_counter() - started
+        latencies = [latency * 1000 for latency, _ in samples]
+        quantiles = (statistics.quantiles(latencies, n=100)
+                     if len(latencies) > 1 else latencies * 99)
+        return {
+            'p50_ms': percentile(quantiles, 50),
+            'p95_ms': percentile(quantiles, 95),
+            'p99_ms': percentile(quantiles, 99),
+            'mean_ms': statistics.fmean(latencies) if latencies else 0.0,
+            # При конкурентных async-запросах SQL идёт из общего потока,
+            # поэтому считаем среднее по всему прогону
+            'queries_per_request': counter.total / requests,
+            'throughput_rps': requests / elapsed if elapsed else 0.0,
+            'errors': sum(status >= 400 for _, status in samples),
+        }
+
+    def wsgi_caller(self, path, query, cookie):
+        application = WSGIHandler()
+        factory = RequestFactory()
+        data = QueryDict(query)
+
+        def call():
+            environ = factory.get(path, data, HTTP_COOKIE=cookie).environ
+            statuses = []
+
+            def start_response(status, headers, exc_info=None):
+                statuses.append(int(status.split()[0]))
+
+            started = time.perf_counter()
+            response = application(environ, start_response)
+            for _ in response:
+                pass
+            response.close()
+            return time.perf_counter() - started, statuses[0]
+
+        return call
+
+    def asgi_caller(self, path, query, cookie):
+        application = ASGIHandler()
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': quote(query, safe='=&').encode(),
+            'root_path': '',
+            'headers': [(b'host', b'testserver'),
+                        (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+
+        async def coroutine():
+            statuses = []
+            requested = asyncio.Event()
+
+            async def receive():
+                if requested.is_set():
+                    # Клиент не отключается, пока ответ не отправлен
+                    await asyncio.Future()
+                requested.set()
+                return {'type': 'http.request', 'body': b'',
+                        'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            started = time.perf_counter()
+            await application(dict(scope), receive, send)
+            return time.perf_counter() - started, statuses[0]
+
+        def call():
+            return asyncio.run(coroutine())
+
+        call.coroutine = coroutine
+        return call
+
+    async def run_async(self, coroutine, requests, concurrency):
+        """Гоняет запросы в одном цикле событий, не больше concurrency разом."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                return await coroutine()
+
+        return await asyncio.gather(*(limited() for _ in range(requests)))
+
+    def compare(self, baseline_path, candidate_path):
+        with open(baseline_path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        with open(candidate_path, encoding='utf-8') as file:
+            candidate = json.load(file)
+        self.stdout.write(
+            f'{"":<28} {baseline["interface"]:>12} '
+            f'{candidate["interface"]:>12}   изменение')
+        for name, before in baseline['routes'].items():
+            after = candidate['routes'].get(name)
+            if after is None:
+                continue
+            ratio = (after['throughput_rps'] / before['throughput_rps']
+                     if before['throughput_rps'] else 0.0)
+            self.stdout.write(
+                f'{name:<28} {before["throughput_rps"]:8.1f} rps '
+                f'{after["throughput_rps"]:8.1f} rps   x{ratio:.2f}')
+
+
+class QueryCounter:
+    """Считает SQL-запросы во всех потоках, пока открыт контекст.
+
+    Обёртка ставится на каждое соединение с момента создания: поток
+    sync_to_async открывает своё соединение ещё на прогреве.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.active = False
+        self._lock = threading.Lock()
+        for conn in connections.all():
+            self._install(conn)
+        connection_created.connect(self._install, weak=False)
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            with self._lock:
+                self.total += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        self.total = 0
+        self.active = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active = False
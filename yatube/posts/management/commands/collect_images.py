@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import StoredImage
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы картинок и их миниатюры, на которые не ссылается '
+            'ни один пост')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            names = list(StoredImage.objects.orphans().values_list(
+                'name', flat=True))
+            for name in names:
+                self.stdout.write(name)
+            self.stdout.write(f'Будет удалено файлов: {len(names)}')
+            return
+        names = StoredImage.objects.collect()
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {len(names)}'))
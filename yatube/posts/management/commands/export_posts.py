@@ -0,0 +1,96 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Follow, Group, Post
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, посты, комментарии и подписки в NDJSON: '
+            'по объекту JSON на строку, в порядке, который понимает '
+            'import_posts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-',
+                            help='Файл для выгрузки, «-» — stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        if options['output'] == '-':
+            self.export(self.stdout)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                self.export(stream)
+
+    def export(self, stream):
+        # Группы и посты идут раньше ссылающихся на них строк,
+        # поэтому импорт проходит файл за один раз
+        for name, rows in (
+            ('Группы', self.groups()),
+            ('Посты', self.posts()),
+            ('Комментарии', self.comments()),
+            ('Подписки', self.follows()),
+        ):
+            started = time.monotonic()
+            count = 0
+            for row in rows:
+                stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+                count += 1
+            elapsed = time.monotonic() - started
+            rate = count / elapsed if elapsed else count
+            self.stderr.write(f'{name}: {count} ({rate:,.0f} строк/с)')
+
+    def _iterate(self, queryset, *fields):
+        # values() без сортировки: iterator() читает курсор порциями
+        # и не держит в памяти ни выборку, ни экземпляры моделей
+        return queryset.order_by('pk').values(*fields).iterator(
+            chunk_size=self.chunk_size)
+
+    def groups(self):
+        for row in self._iterate(Group.objects, 'slug', 'title',
+                                 'description'):
+            yield {'model': 'group', **row}
+
+    def posts(self):
+        rows = self._iterate(Post.objects, 'pk', 'author__username',
+                             'group__slug', 'text', 'pub_date', 'updated',
+                             'image')
+        for row in rows:
+            yield {
+                'model': 'post',
+                'id': row['pk'],
+                'author': row['author__username'],
+                'group': row['group__slug'],
+                'text': row['text'],
+                'pub_date': _date(row['pub_date']),
+                'updated': _date(row['updated']),
+                'image': row['image'] or None,
+            }
+
+    def comments(self):
+        rows = self._iterate(Comment.objects, 'post_id', 'author__username',
+                             'text', 'created')
+        for row in rows:
+            yield {
+                'model': 'comment',
+                'post': row['post_id'],
+                'author': row['author__username'],
+                'text': row['text'],
+                'created': _date(row['created']),
+            }
+
+    def follows(self):
+        rows = self._iterate(Follow.objects, 'user__username',
+                             'author__username')
+        for row in rows:
+            yield {
+                'model': 'follow',
+                'user': row['user__username'],
+                'author': row['author__username'],
+            }
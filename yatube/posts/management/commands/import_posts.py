@@ -0,0 +1,215 @@
+import json
+import sys
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import caching
+from posts.models import Comment, Follow, Group, Post, StoredImage
+from posts.utils import explicit_dates
+
+User = get_user_model()
+
+NAMES = {
+    'group': 'Группы',
+    'post': 'Посты',
+    'comment': 'Комментарии',
+    'follow': 'Подписки',
+}
+
+
+class Command(BaseCommand):
+    help = ('Загружает NDJSON из export_posts пакетами bulk_create; '
+            'недостающие авторы создаются без пароля, уже загруженные '
+            'посты и комментарии пропускаются')
+    stealth_options = ('stdin',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', default='-',
+                            help='Файл с выгрузкой, «-» — stdin')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.user_ids = {}
+        self.group_ids = {}
+        # id поста в выгрузке -> id в этой базе, для комментариев
+        self.post_ids = {}
+        self.orphans = 0
+        self.stats = {kind: [0, 0, 0.0] for kind in NAMES}
+        if options['input'] == '-':
+            self.load(options.get('stdin', sys.stdin))
+        else:
+            with open(options['input'], encoding='utf-8') as stream:
+                self.load(stream)
+        for kind, (created, skipped, elapsed) in self.stats.items():
+            if created or skipped:
+                rate = created / elapsed if elapsed else created
+                self.stdout.write(
+                    f'{NAMES[kind]}: {created} ({rate:,.0f} строк/с), '
+                    f'пропущено {skipped}')
+        if self.orphans:
+            self.stdout.write(self.style.WARNING(
+                f'Комментариев к постам не из выгрузки: {self.orphans}'))
+        if any(created for created, _, _ in self.stats.values()):
+            self.stdout.write('Пересчёт счётчиков и лент...')
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command('rebuild_timelines', stdout=self.stdout)
+            if self.stats['post'][0]:
+                call_command('backfill_thumbnails', stdout=self.stdout)
+            caching.bump(caching.GLOBAL)
+
+    def load(self, stream):
+        kind, batch = None, []
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CommandError(f'Строка {number}: некорректный JSON')
+            if not isinstance(record, dict) or record.get('model') not in NAMES:
+                raise CommandError(f'Строка {number}: неизвестная запись')
+            if record['model'] != kind or len(batch) >= self.batch_size:
+                self.flush(kind, batch)
+                kind, batch = record['model'], []
+            batch.append(record)
+        self.flush(kind, batch)
+
+    def flush(self, kind, records):
+        """Сохраняет пакет одной транзакцией."""
+        if not records:
+            return
+        started = time.monotonic()
+        with transaction.atomic(), explicit_dates(Post, Comment):
+            created = getattr(self, f'load_{kind}s')(records)
+        stats = self.stats[kind]
+        stats[0] += created
+        stats[1] += len(records) - created
+        stats[2] += time.monotonic() - started
+
+    def resolve_users(self, usernames):
+        missing = set(usernames) - self.user_ids.keys() - {None}
+        if missing:
+            User.objects.bulk_create(
+                [User(username=name, password=make_password(None))
+                 for name in missing],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            self.user_ids.update(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+
+    def resolve_groups(self, slugs):
+        missing = set(slugs) - self.group_ids.keys() - {None}
+        if missing:
+            self.group_ids.update(Group.objects.filter(
+                slug__in=missing).values_list('slug', 'pk'))
+
+    def load_groups(self, records):
+        # Существующие группы с тем же слагом остаются как есть
+        existing = set(Group.objects.filter(
+            slug__in=[record['slug'] for record in records]
+        ).values_list('slug', flat=True))
+        groups = {
+            record['slug']: Group(slug=record['slug'],
+                                  title=record['title'],
+                                  description=record.get('description', ''))
+            for record in records if record['slug'] not in existing
+        }
+        Group.objects.bulk_create(groups.values())
+        self.resolve_groups(record['slug'] for record in records)
+        return len(groups)
+
+    def load_posts(self, records):
+        self.resolve_users(record['author'] for record in records)
+        self.resolve_groups(record.get('group') for record in records)
+        now = timezone.now()
+        keys, posts = [], {}
+        for record in records:
+            pub_date = parse_datetime(record.get('pub_date') or '') or now
+            keys.append((self.user_ids[record['author']], pub_date,
+                         record['text']))
+            posts.setdefault(keys[-1], Post(
+                author_id=keys[-1][0],
+                group_id=self.group_ids.get(record.get('group')),
+                text=record['text'],
+                pub_date=pub_date,
+                updated=parse_datetime(record.get('updated') or '')
+                or pub_date,
+                image=record.get('image') or '',
+            ))
+        # Естественный ключ (автор, дата, текст): повторный импорт той
+        # же выгрузки не дублирует посты
+        existing = {
+            (author_id, pub_date, text): pk
+            for author_id, pub_date, text, pk in Post.objects.filter(
+                author_id__in={key[0] for key in posts},
+                pub_date__in={key[1] for key in posts},
+            ).values_list('author_id', 'pub_date', 'text', 'pk')
+        }
+        new = [post for key, post in posts.items() if key not in existing]
+        # На SQLite и PostgreSQL bulk_create возвращает новые id
+        Post.objects.bulk_create(new)
+        # bulk_create не шлёт сигналов: ссылки на картинки считаем здесь
+        images = Counter(post.image.name for post in new if post.image)
+        for name, count in images.items():
+            StoredImage.objects.acquire(name, count)
+        for record, key in zip(records, keys):
+            if record.get('id') is not None:
+                self.post_ids[record['id']] = (existing.get(key)
+                                               or posts[key].pk)
+        return len(new)
+
+    def load_comments(self, records):
+        known = [record for record in records
+                 if record.get('post') in self.post_ids]
+        # Пост комментария не попал в выгрузку: такие строки пропущены
+        self.orphans += len(records) - len(known)
+        self.resolve_users(record['author'] for record in known)
+        now = timezone.now()
+        comments = {}
+        for record in known:
+            comment = Comment(
+                post_id=self.post_ids[record['post']],
+                author_id=self.user_ids[record['author']],
+                text=record['text'],
+                created=parse_datetime(record.get('created') or '') or now)
+            comments.setdefault((comment.post_id, comment.author_id,
+                                 comment.created, comment.text), comment)
+        existing = set(Comment.objects.filter(
+            post_id__in={key[0] for key in comments},
+            created__in={key[2] for key in comments},
+        ).values_list('post_id', 'author_id', 'created', 'text'))
+        new = [comment for key, comment in comments.items()
+               if key not in existing]
+        Comment.objects.bulk_create(new)
+        return len(new)
+
+    def load_follows(self, records):
+        self.resolve_users(
+            name for record in records
+            for name in (record['user'], record['author']))
+        pairs = {
+            (self.user_ids[record['user']], self.user_ids[record['author']])
+            for record in records if record['user'] != record['author']
+        }
+        existing = set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            author_id__in={author_id for _, author_id in pairs},
+        ).values_list('user_id', 'author_id'))
+        pairs -= existing
+        # ignore_conflicts страхует от параллельной записи тех же пар
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            ignore_conflicts=True,
+        )
+        return len(pairs)
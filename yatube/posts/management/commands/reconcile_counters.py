@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import StoredImage, UserStats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики постов, комментариев, '
+            'подписок и ссылок на картинки')
+
+    def handle(self, *args, **options):
+        UserStats.objects.reconcile()
+        StoredImage.objects.reconcile()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
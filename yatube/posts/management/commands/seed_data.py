@@ -0,0 +1,188 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import caching
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import explicit_dates
+
+User = get_user_model()
+
+WORDS = (
+    'яндекс практикум джанго питон пост лента подписка группа автор '
+    'комментарий кеш индекс запрос страница картинка сообщество день '
+    'новость код тест сервер база данных курсор миграция шаблон'
+).split()
+
+
+def zipf_weights(size, exponent):
+    """Веса «длинного хвоста»: первые элементы выбираются чаще всех."""
+    return [1 / (rank ** exponent) for rank in range(1, size + 1)]
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками для нагрузочных тестов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=200_000)
+        parser.add_argument('--follows', type=int, default=20_000)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель Ципфа: чем больше, тем сильнее перекос '
+                 'к «звёздным» авторам и огромным тредам')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Период, по которому распределяются даты')
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Зерно генератора для воспроизводимости')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days'])
+        started = time.monotonic()
+
+        user_ids = self.create_users(options['users'], options['prefix'])
+        group_ids = self.create_groups(options['groups'], options['prefix'])
+        post_ids = self.create_posts(options['posts'], user_ids, group_ids)
+        self.create_comments(options['comments'], user_ids, post_ids)
+        self.create_follows(options['follows'], user_ids)
+
+        self.stdout.write('Пересчёт счётчиков и лент...')
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        caching.bump(caching.GLOBAL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
+
+    def _report(self, name, count, started):
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else count
+        self.stdout.write(f'{name}: {count} ({rate:,.0f} строк/с)')
+
+    def _bulk_create(self, model, objects):
+        with transaction.atomic(), explicit_dates(model):
+            model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def _text(self, low, high):
+        return ' '.join(self.random.choices(
+            WORDS, k=self.random.randint(low, high))).capitalize()
+
+    def _date(self):
+        return self.now - self.period * self.random.random()
+
+    def create_users(self, count, prefix):
+        started = time.monotonic()
+        # Один хеш на всех: make_password на каждого занял бы минуты
+        password = make_password(None)
+        offset = User.objects.filter(
+            username__startswith=f'{prefix}_user_').count()
+        self._bulk_create(User, [
+            User(username=f'{prefix}_user_{offset + i}',
+                 first_name=f'Автор {offset + i}',
+                 password=password,
+                 date_joined=self.now)
+            for i in range(count)
+        ])
+        self._report('Пользователи', count, started)
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_user_').values_list(
+            'pk', flat=True))
+
+    def create_groups(self, count, prefix):
+        started = time.monotonic()
+        offset = Group.objects.filter(
+            slug__startswith=f'{prefix}-group-').count()
+        self._bulk_create(Group, [
+            Group(title=f'Группа {offset + i}',
+                  slug=f'{prefix}-group-{offset + i}',
+                  description=self._text(5, 20))
+            for i in range(count)
+        ])
+        self._report('Группы', count, started)
+        return list(Group.objects.filter(
+            slug__startswith=f'{prefix}-group-').values_list(
+            'pk', flat=True))
+
+    def create_posts(self, count, user_ids, group_ids):
+        started = time.monotonic()
+        authors = list(user_ids)
+        self.random.shuffle(authors)
+        weights = zipf_weights(len(authors), self.skew)
+        groups = [None, *group_ids]
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            posts = []
+            for author_id in self.random.choices(authors, weights, k=size):
+                pub_date = self._date()
+                posts.append(Post(
+                    author_id=author_id,
+                    group_id=self.random.choice(groups),
+                    text=self._text(10, 80),
+                    pub_date=pub_date,
+                    updated=pub_date,
+                ))
+            self._bulk_create(Post, posts)
+        self._report('Посты', count, started)
+        return list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:count])
+
+    def create_comments(self, count, user_ids, post_ids):
+        started = time.monotonic()
+        threads = list(post_ids)
+        self.random.shuffle(threads)
+        weights = zipf_weights(len(threads), self.skew)
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            self._bulk_create(Comment, [
+                Comment(post_id=post_id,
+                        author_id=self.random.choice(user_ids),
+                        text=self._text(3, 30),
+                        created=self._date())
+                for post_id in self.random.choices(threads, weights, k=size)
+            ])
+        self._report('Комментарии', count, started)
+
+    def create_follows(self, count, user_ids):
+        started = time.monotonic()
+        authors = list(user_ids)
+        self.random.shuffle(authors)
+        weights = zipf_weights(len(authors), self.skew)
+        known = set(Follow.objects.values_list('user_id', 'author_id'))
+        pairs = set()
+        # Подписки тянутся к «звёздам»; повторы и подписки на себя
+        # отбрасываются, поэтому кандидатов берём с запасом
+        for _ in range(10):
+            if len(pairs) >= count:
+                break
+            candidates = zip(
+                self.random.choices(user_ids, k=count),
+                self.random.choices(authors, weights, k=count),
+            )
+            for pair in candidates:
+                if pair[0] != pair[1] and pair not in known:
+                    pairs.add(pair)
+                    if len(pairs) == count:
+                        break
+        with transaction.atomic():
+            Follow.objects.bulk_create(
+                [Follow(user_id=user_id, author_id=author_id)
+                 for user_id, author_id in pairs],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+        self._report('Подписки', len(pairs), started)
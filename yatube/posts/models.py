@@ -1,6 +1,11 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import models, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth import get_user_model
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 CHARACTERS = 15
 
@@ -8,6 +13,7 @@ CHARACTERS = 15
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст поста')
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации')
+    updated = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='posts', verbose_name='Автор')
@@ -20,17 +26,38 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    thumbnails = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Миниатюры',
+        help_text='URL миниатюр картинки по именам из POST_THUMBNAILS')
+    comments_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Комментариев')
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date', 'author')
+        # Индексы повторяют порядок лент вместе с pk из курсора пагинации
+        indexes = (
+            models.Index(fields=('-pub_date', 'author', 'id'),
+                         name='post_feed_idx'),
+            models.Index(fields=('author', '-pub_date', 'id'),
+                         name='post_author_feed_idx'),
+            models.Index(fields=('group', '-pub_date', 'author', 'id'),
+                         name='post_group_feed_idx'),
+        )
 
     def __str__(self):
         return self.text[:CHARACTERS]
 
+    def save(self, *args, **kwargs):
+        # Счётчики обновляются в post_save внутри той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Название')
@@ -64,6 +91,14 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ('-created', 'author')
+        indexes = (
+            models.Index(fields=('post', '-created', 'id'),
+                         name='comment_post_page_idx'),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 
 class Follow(models.Model):
@@ -83,3 +118,223 @@ class Follow(models.Model):
             models.UniqueConstraint(
                 fields=('user', 'author'), name='Уникальная подписка'),
         )
+        indexes = (
+            models.Index(fields=('author', 'user'),
+                         name='follow_author_idx'),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class TimelineEntry(models.Model):
+    """Строка материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write), поэтому
+    страница /follow/ читается одним диапазоном по индексу.
+    """
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Подписчик')
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='timeline_entries',
+                             verbose_name='Пост')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='Автор поста')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ('-pub_date', 'author', 'post')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='Уникальная запись ленты'),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', 'author', 'post'),
+                name='timeline_user_feed_idx'),
+        )
+
+
+def _count(model, field):
+    """Подзапрос с числом строк model, ссылающихся на внешний user_id."""
+    rows = model.objects.filter(**{field: OuterRef('user_id')}).order_by()
+    return Coalesce(
+        Subquery(rows.values(field).annotate(n=Count('pk')).values('n')),
+        Value(0),
+    )
+
+
+class UserStatsManager(models.Manager):
+    def adjust(self, user_id, **deltas):
+        """Атомарно сдвигает счётчики пользователя на заданные величины."""
+        updated = self.filter(user_id=user_id).update(**{
+            field: Greatest(F(field) + delta, Value(0))
+            for field, delta in deltas.items()
+        })
+        if not updated and all(delta > 0 for delta in deltas.values()):
+            # Строки ещё нет — считаем её целиком, изменение уже в базе
+            self.reconcile([user_id])
+
+    def for_user(self, user):
+        try:
+            return self.get(user_id=user.pk)
+        except UserStats.DoesNotExist:
+            self.reconcile([user.pk])
+            # Реплика могла ещё не получить только что созданную строку
+            return self.db_manager(router.db_for_write(UserStats)).get(
+                user_id=user.pk)
+
+    async def afor_user(self, user):
+        try:
+            return await self.aget(user_id=user.pk)
+        except UserStats.DoesNotExist:
+            await sync_to_async(self.reconcile)([user.pk])
+            return await self.db_manager(
+                router.db_for_write(UserStats)).aget(user_id=user.pk)
+
+    def reconcile(self, user_ids=None):
+        """Пересчитывает счётчики по фактическим данным."""
+        users = User.objects.all()
+        posts = Post.objects.all()
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+            posts = posts.filter(author_id__in=user_ids)
+        with transaction.atomic():
+            self.bulk_create(
+                [UserStats(user_id=pk)
+                 for pk in users.values_list('pk', flat=True)],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            self.filter(user_id__in=users.values('pk')).update(
+                posts_count=_count(Post, 'author'),
+                comments_count=_count(Comment, 'author'),
+                followers_count=_count(Follow, 'author'),
+                following_count=_count(Follow, 'user'),
+            )
+            posts.update(comments_count=Coalesce(
+                Subquery(
+                    Comment.objects.filter(post=OuterRef('pk')).order_by()
+                    .values('post').annotate(n=Count('pk')).values('n')
+                ),
+                Value(0),
+            ))
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats',
+                                verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField(default=0,
+                                              verbose_name='Постов')
+    comments_count = models.PositiveIntegerField(
+        default=0, verbose_name='Комментариев')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков')
+    following_count = models.PositiveIntegerField(default=0,
+                                                  verbose_name='Подписок')
+
+    objects = UserStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+def _delete_image(name):
+    # Вместе с файлом — миниатюры и записи о них в хранилище sorl
+    from sorl.thumbnail import default
+    from sorl.thumbnail.images import ImageFile
+
+    image = ImageFile(name, Post._meta.get_field('image').storage)
+    default.kvstore.delete(image)
+    image.delete()
+
+
+class StoredImageManager(models.Manager):
+    def acquire(self, name, count=1):
+        """Ещё count постов ссылаются на файл name."""
+        updated = self.filter(name=name).update(
+            references=F('references') + count)
+        if not updated:
+            self.create(name=name, references=count)
+
+    def release(self, name):
+        """Пост больше не ссылается на name; последний удаляет файл."""
+        self.filter(name=name, references__gt=0).update(
+            references=F('references') - 1)
+        # Если транзакция откатится, файл должен остаться
+        transaction.on_commit(lambda: self.collect([name]))
+
+    def orphans(self):
+        """Файлы, на которые не ссылается ни один пост, по самим постам."""
+        return self.exclude(
+            name__in=Post.objects.exclude(image='').values('image'))
+
+    def collect(self, names=None):
+        """Удаляет файлы без ссылок: names со счётчиком 0 или все сироты.
+
+        Проверка и удаление идут в одной пишущей транзакции, а загрузка
+        нового поста пишет файл внутри своей, поэтому файл не пропадёт
+        из-под поста с такой же картинкой.
+        """
+        deleted = []
+        with transaction.atomic():
+            if names is None:
+                orphans = self.orphans()
+            else:
+                orphans = self.filter(name__in=names, references=0)
+            for name in orphans.values_list('name', flat=True):
+                _delete_image(name)
+                deleted.append(name)
+            self.filter(name__in=deleted).delete()
+        return deleted
+
+    def reconcile(self):
+        """Пересчитывает ссылки по фактическим постам; файлы не трогает."""
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True).distinct()
+        with transaction.atomic():
+            self.bulk_create(
+                [StoredImage(name=name) for name in names.iterator()],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            self.update(references=Coalesce(
+                Subquery(
+                    Post.objects.filter(image=OuterRef('name')).order_by()
+                    .values('image').annotate(n=Count('pk')).values('n')
+                ),
+                Value(0),
+            ))
+
+
+class StoredImage(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются."""
+    name = models.CharField(max_length=255, primary_key=True,
+                            verbose_name='Файл')
+    references = models.PositiveIntegerField(default=0,
+                                             verbose_name='Ссылок')
+
+    objects = StoredImageManager()
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
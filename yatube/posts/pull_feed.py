@@ -0,0 +1,186 @@
+"""Лента подписок по модели pull: слияние последних постов авторов.
+
+Для каждого автора в кеше лежат его последние RECENT_PER_AUTHOR постов
+как array('q') троек (-pub_date в микросекундах, author_id, post_id):
+в таком виде тройки упорядочены как лента. Страница /follow/
+собирается k-путевым слиянием (heapq.merge) списков авторов, на
+которых подписан пользователь, и из базы одним in_bulk достаются
+только посты страницы. Публикация ничего не пишет в ленты подписчиков:
+ключ списка содержит поколение ленты автора, и после нового поста
+список перечитывается одним запросом при первом обращении.
+
+Списки ограничены, поэтому слияние верно только до «горизонта» —
+самой старой тройки среди урезанных списков. Страницы глубже
+читаются запросом author_id IN (...) по индексу постов.
+"""
+import datetime
+import hashlib
+import heapq
+from array import array
+from itertools import islice
+
+from django.core.cache import cache
+from django.http import QueryDict
+
+from . import caching, follow_graph
+from .models import Post
+from .utils import (ORDERING, CursorPage, CursorPaginator, decode_cursor,
+                    encode_cursor)
+
+RECENT_PER_AUTHOR = 200
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _entry(pub_date, author_id, post_id):
+    return (-((pub_date - _EPOCH) // _MICROSECOND), author_id, post_id)
+
+
+def _key(post):
+    return list(_entry(post.pub_date, post.author_id, post.pk))
+
+
+class _Recent:
+    """Тройки одного автора в плоском массиве, без распаковки в кортежи."""
+
+    __slots__ = ('items', 'size')
+
+    def __init__(self, packed):
+        self.items = array('q')
+        self.items.frombytes(packed)
+        self.size = len(self.items) // 3
+
+    def __getitem__(self, index):
+        start = index * 3
+        return tuple(self.items[start:start + 3])
+
+    def bisect(self, target, right):
+        """Первая тройка больше target (right) или не меньше его."""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            item = self[middle]
+            if item < target or right and item == target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def forward(self, start):
+        for index in range(start, self.size):
+            yield self[index]
+
+    def backward(self, end):
+        for index in range(end - 1, -1, -1):
+            yield self[index]
+
+    @property
+    def truncated(self):
+        return self.size >= RECENT_PER_AUTHOR
+
+
+def _load(author_id):
+    rows = Post.objects.filter(author_id=author_id).order_by(
+        *ORDERING).values_list('pub_date', 'author_id', 'pk')
+    items = array('q')
+    for row in rows[:RECENT_PER_AUTHOR]:
+        items.extend(_entry(*row))
+    return items.tobytes()
+
+
+def _versions(user_id, author_ids):
+    return caching.scope_versions(
+        caching.following_scope(user_id),
+        *(caching.author_scope(pk) for pk in author_ids))
+
+
+def recent_lists(author_ids, versions):
+    """Кешированные списки последних постов авторов."""
+    keys = {
+        f'recent-posts:{pk}:{versions[caching.GLOBAL]}.'
+        f'{versions[caching.author_scope(pk)]}': pk
+        for pk in author_ids
+    }
+    found = cache.get_many(keys)
+    missing = {key: _load(pk) for key, pk in keys.items()
+               if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [_Recent(found[key]) for key in keys]
+
+
+def version(user_id):
+    """Короткое поколение ленты: подписки и ленты всех авторов."""
+    author_ids = follow_graph.followees(user_id)
+    versions = _versions(user_id, author_ids)
+    raw = '.'.join(str(value) for value in versions.values())
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _sql_cursor(values):
+    # Курсор страницы из запроса по базе: дата в нём строкой
+    return bool(values) and isinstance(values[0], str)
+
+
+def _valid(values):
+    return (values is not None and len(values) == 3
+            and all(isinstance(value, int) for value in values))
+
+
+def _hydrate(entries):
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for _, _, post_id in entries])
+    return [posts[post_id] for _, _, post_id in entries if post_id in posts]
+
+
+def get_page(user_id, per_page, after=None, before=None, params=None):
+    """Страница ленты подписок без таблицы TimelineEntry."""
+    params = params if params is not None else QueryDict()
+    author_ids = follow_graph.followees(user_id)
+    queryset = Post.objects.filter(author_id__in=list(author_ids))
+    after_values, before_values = decode_cursor(after), decode_cursor(before)
+    if _sql_cursor(after_values) or _sql_cursor(before_values):
+        return CursorPaginator(queryset, per_page).get_page(
+            after, before, params)
+    versions = _versions(user_id, author_ids)
+    lists = recent_lists(author_ids, versions)
+    truncated = [recent[recent.size - 1] for recent in lists
+                 if recent.truncated]
+    horizon = min(truncated) if truncated else None
+    if _valid(before_values):
+        target = tuple(before_values)
+        entries = list(islice(heapq.merge(
+            *(recent.backward(recent.bisect(target, right=False))
+              for recent in lists), reverse=True), per_page + 1))
+        if entries:
+            has_previous = len(entries) > per_page
+            entries = entries[:per_page][::-1]
+            return CursorPage(_hydrate(entries), _key, params,
+                              has_next=True, has_previous=has_previous)
+    has_previous = _valid(after_values)
+    target = tuple(after_values) if has_previous else None
+    entries = list(islice(heapq.merge(
+        *(recent.forward(recent.bisect(target, right=True) if target else 0)
+          for recent in lists)), per_page + 1))
+    if horizon is not None and (
+            len(entries) <= per_page or entries[-1] > horizon):
+        # Страница уходит за урезанный список: дальше читаем из базы
+        return _sql_page(queryset, per_page, target, params)
+    if has_previous and not entries:
+        return get_page(user_id, per_page, params=params)
+    has_next = len(entries) > per_page
+    return CursorPage(_hydrate(entries[:per_page]), _key, params,
+                      has_next=has_next, has_previous=has_previous)
+
+
+def _sql_page(queryset, per_page, after, params):
+    paginator = CursorPaginator(queryset, per_page)
+    if after is None:
+        return paginator.get_page(params=params)
+    micros, author_id, post_id = after
+    # Та же позиция, но токеном в формате CursorPaginator
+    pub_date = _EPOCH + datetime.timedelta(microseconds=-micros)
+    return paginator.get_page(
+        encode_cursor([pub_date, author_id, post_id]), params=params)
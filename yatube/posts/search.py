@@ -0,0 +1,153 @@
+"""Полнотекстовый поиск по постам через SQLite FTS5.
+
+Таблица posts_post_fts хранит только индекс (content='posts_post'),
+а триггеры синхронизируют её с Post.text при любой записи, включая
+bulk_create и update(). Результаты ранжируются по bm25.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.http import QueryDict
+
+from .models import Post
+from .utils import CursorPage, CursorPaginator, decode_cursor
+
+FTS_TABLE = 'posts_post_fts'
+
+FTS_SCHEMA = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(text, content='posts_post', content_rowid='id')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+)
+
+_MATCHES = f"""
+    SELECT rowid AS id, bm25({FTS_TABLE}) AS score
+    FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+"""
+
+
+def is_supported(conn=connection):
+    return conn.vendor == 'sqlite'
+
+
+def ensure_schema(conn=connection):
+    """Создаёт индекс и триггеры, если их нет.
+
+    SQLite-миграции Django пересоздают таблицу posts_post при изменении
+    полей, и триггеры при этом теряются, поэтому схема проверяется
+    после каждой миграции.
+    """
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+
+
+def rebuild(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def match_expression(query):
+    """Превращает пользовательский ввод в безопасный запрос FTS5.
+
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 во вводе
+    не интерпретируются; слова объединяются через AND.
+    """
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+
+def filter_queryset(queryset, query):
+    """Ограничивает queryset постами, подходящими под запрос."""
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    if not is_supported():
+        return queryset.filter(text__icontains=query)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,),
+    ))
+
+
+def _key(post):
+    return [post.search_score, post.pk]
+
+
+def _fetch(match, values, reverse, limit):
+    sql = f'SELECT id, score FROM ({_MATCHES})'
+    params = [match]
+    if values is not None:
+        sign = '<' if reverse else '>'
+        sql += f' WHERE score {sign} %s OR (score = %s AND id {sign} %s)'
+        params += [values[0], values[0], values[1]]
+    direction = 'DESC' if reverse else 'ASC'
+    sql += f' ORDER BY score {direction}, id {direction} LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _valid(values):
+    return (values is not None and len(values) == 2
+            and all(isinstance(value, (int, float)) for value in values))
+
+
+def search_page(query, per_page, after=None, before=None, params=None):
+    """Страница результатов поиска с keyset-пагинацией по (bm25, id)."""
+    params = params if params is not None else QueryDict()
+    match = match_expression(query)
+    if not match:
+        return CursorPage([], _key, params, False, False)
+    if not is_supported():
+        queryset = filter_queryset(Post.objects.all(), query)
+        return CursorPaginator(queryset, per_page).get_page(
+            after, before, params)
+    after, before = decode_cursor(after), decode_cursor(before)
+    has_next = has_previous = False
+    rows = []
+    if _valid(before):
+        rows = _fetch(match, before, True, per_page + 1)
+        if rows:
+            has_previous = len(rows) > per_page
+            has_next = True
+            rows = rows[:per_page][::-1]
+    if not rows:
+        has_previous = _valid(after)
+        rows = _fetch(match, after if has_previous else None, False,
+                      per_page + 1)
+        if has_previous and not rows:
+            # Курсор указывает за конец выдачи — показываем первую страницу
+            has_previous = False
+            rows = _fetch(match, None, False, per_page + 1)
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for pk, _ in rows])
+    results = []
+    for pk, score in rows:
+        post = posts.get(pk)
+        if post is not None:
+            post.search_score = score
+            results.append(post)
+    if not results:
+        has_next = has_previous = False
+    return CursorPage(results, _key, params, has_next, has_previous)
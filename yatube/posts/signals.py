@@ -0,0 +1,207 @@
+from django.db import connections, router
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.signals import replicated
+
+from . import caching, search, timeline
+from .models import (Comment, Follow, Group, Post, StoredImage, User,
+                     UserStats)
+
+# Поля пользователя, которые видны в карточке поста
+CARD_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created and timeline.enabled():
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created and timeline.enabled():
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    if timeline.enabled():
+        timeline.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.adjust(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    UserStats.objects.adjust(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1)
+        UserStats.objects.adjust(instance.author_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id, comments_count__gt=0).update(
+        comments_count=F('comments_count') - 1)
+    UserStats.objects.adjust(instance.author_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.adjust(instance.author_id, followers_count=1)
+        UserStats.objects.adjust(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    UserStats.objects.adjust(instance.author_id, followers_count=-1)
+    UserStats.objects.adjust(instance.user_id, following_count=-1)
+
+
+def _post_scopes(post, group_ids):
+    scopes = (
+        caching.INDEX,
+        caching.author_scope(post.author_id),
+        caching.post_scope(post.pk),
+        *(caching.group_scope(pk) for pk in group_ids if pk),
+    )
+    if not timeline.enabled():
+        # Лента pull сама следит за поколениями лент авторов
+        return scopes
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True)
+    return (*scopes,
+            *(caching.follow_scope(pk) for pk in followers.iterator()))
+
+
+def _card_scopes(posts, *scopes):
+    """scopes и поколения лент, где показаны посты posts."""
+    rows = set(posts.order_by().values_list('author_id', 'group_id')
+               .distinct())
+    author_ids = {author_id for author_id, _ in rows}
+    scopes = {
+        *scopes,
+        *(caching.author_scope(pk) for pk in author_ids),
+        *(caching.group_scope(pk) for _, pk in rows if pk),
+    }
+    if rows:
+        scopes.add(caching.INDEX)
+    if rows and timeline.enabled():
+        followers = Follow.objects.filter(
+            author_id__in=author_ids).values_list('user_id', flat=True)
+        scopes.update(caching.follow_scope(pk)
+                      for pk in followers.distinct().iterator())
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, **kwargs):
+    # При смене группы пост нужно убрать и из ленты старой группы, а при
+    # смене картинки — отпустить ссылку на старый файл
+    previous = instance.pk and Post.objects.using(
+        router.db_for_write(Post)).filter(pk=instance.pk).values_list(
+        'group_id', 'image').first()
+    instance._old_group_id, instance._old_image = previous or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, **kwargs):
+    image = instance.image.name or ''
+    old_image = getattr(instance, '_old_image', '')
+    if image == old_image:
+        return
+    if image:
+        StoredImage.objects.acquire(image)
+    if old_image:
+        StoredImage.objects.release(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    if instance.image:
+        StoredImage.objects.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    group_ids = {instance.group_id, getattr(instance, '_old_group_id', None)}
+    caching.invalidate(*_post_scopes(instance, group_ids))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_post(sender, instance, **kwargs):
+    caching.invalidate(caching.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_feed(sender, instance, created, **kwargs):
+    if created:
+        caching.invalidate(caching.INDEX, caching.group_scope(instance.pk))
+    else:
+        # Адрес группы показан в карточках её постов во всех лентах
+        caching.invalidate(*_card_scopes(
+            instance.posts.all(), caching.group_scope(instance.pk),
+            caching.group_card_scope(instance.pk)))
+
+
+@receiver(pre_save, sender=User)
+def remember_user_card(sender, instance, update_fields=None, **kwargs):
+    # Вход сохраняет только last_login, карточки от него не зависят
+    instance._card_changed = False
+    if instance.pk is None or update_fields is not None and not (
+            set(update_fields) & set(CARD_USER_FIELDS)):
+        return
+    previous = User.objects.using(router.db_for_write(User)).filter(
+        pk=instance.pk).values_list(*CARD_USER_FIELDS).first()
+    instance._card_changed = previous is not None and previous != tuple(
+        getattr(instance, field) for field in CARD_USER_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_cards(sender, instance, **kwargs):
+    if getattr(instance, '_card_changed', False):
+        # Имя автора показано в карточках его постов во всех лентах
+        caching.invalidate(*_card_scopes(
+            instance.posts.all(), caching.author_scope(instance.pk),
+            caching.author_card_scope(instance.pk)))
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_all_feeds(sender, instance, **kwargs):
+    # Посты группы остались без неё во всех лентах
+    caching.invalidate(caching.GLOBAL)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, **kwargs):
+    caching.invalidate(
+        caching.follow_scope(instance.user_id),
+        caching.following_scope(instance.user_id),
+        caching.profile_scope(instance.user_id),
+        caching.profile_scope(instance.author_id),
+    )
+
+
+@receiver(replicated)
+def invalidate_replica_feeds(sender, **kwargs):
+    caching.bump(caching.REPLICA)
+
+
+def ensure_search_schema(sender, using, **kwargs):
+    # Пересоздание posts_post в миграциях SQLite удаляет триггеры FTS
+    search.ensure_schema(connections[using])
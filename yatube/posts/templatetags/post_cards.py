@@ -0,0 +1,26 @@
+from django import template
+
+from posts import caching
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def card_version(context, post):
+    """Поколение карточки поста: общее, группы и автора.
+
+    Правка группы или имени автора сбрасывает только их карточки. В
+    пределах запроса поколения запоминаются: у соседних карточек лент
+    обычно общие автор и группа.
+    """
+    scopes = [caching.author_card_scope(post.author_id)]
+    if post.group_id is not None:
+        scopes.append(caching.group_card_scope(post.group_id))
+    request = context.get('request')
+    if request is None:
+        return caching.feed_version(*scopes)
+    versions = request.__dict__.setdefault('_card_versions', {})
+    key = tuple(scopes)
+    if key not in versions:
+        versions[key] = caching.feed_version(*scopes)
+    return versions[key]
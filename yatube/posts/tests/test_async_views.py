@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from django.test import AsyncRequestFactory, TestCase
+
+from .. import async_views
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='async_author')
+        cls.reader = User.objects.create_user(username='async_reader')
+        cls.group = Group.objects.create(
+            title='Асинхронная группа', slug='async-slug', description='-')
+        cls.posts = [
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Асинхронный пост {i}')
+            for i in range(12)
+        ]
+        Comment.objects.create(post=cls.posts[0], author=cls.reader,
+                               text='Асинхронный комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+
+    def _request(self, path, user=None, **params):
+        request = self.factory.get(path, params)
+        request.user = user or AnonymousUser()
+        return request
+
+    async def test_feeds_render(self):
+        """Async-ленты отдают первую страницу из 10 постов"""
+        cases = (
+            (async_views.index, '/', {}),
+            (async_views.groups_posts, '/group/async-slug/',
+             {'slug': 'async-slug'}),
+            (async_views.profile, '/profile/async_author/',
+             {'username': 'async_author'}),
+        )
+        for view, path, kwargs in cases:
+            with self.subTest(path=path):
+                response = await view(self._request(path), **kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Асинхронный пост 11')
+                self.assertNotContains(response, 'Асинхронный пост 1<')
+
+    async def test_post_detail(self):
+        post = self.posts[0]
+        response = await async_views.post_detail(
+            self._request(f'/posts/{post.pk}/'), post_id=post.pk)
+        self.assertContains(response, 'Асинхронный комментарий')
+
+    async def test_missing_objects_raise_404(self):
+        with self.assertRaises(Http404):
+            await async_views.groups_posts(
+                self._request('/group/nope/'), slug='nope')
+
+    async def test_follow_index(self):
+        response = await async_views.follow_index(
+            self._request('/follow/', user=self.reader))
+        self.assertContains(response, 'Асинхронный пост 11')
+        response = await async_views.follow_index(self._request('/follow/'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_unchanged_feed_returns_304(self):
+        response = await async_views.index(self._request('/'))
+        request = self._request('/')
+        request.META['HTTP_IF_NONE_MATCH'] = response['ETag']
+        response = await async_views.index(request)
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,95 @@
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import (Comment, Follow, Group, Post, StoredImage,
+                      TimelineEntry, UserStats)
+
+User = get_user_model()
+
+
+class SeedDataTest(TestCase):
+    def test_seed_data_creates_consistent_data(self):
+        """seed_data создаёт данные и пересчитывает производные таблицы"""
+        call_command('seed_data', users=20, groups=3, posts=200,
+                     comments=300, follows=40, seed=1, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(Follow.objects.count(), 40)
+        self.assertEqual(
+            sum(UserStats.objects.values_list('posts_count', flat=True)), 200)
+        self.assertTrue(TimelineEntry.objects.exists())
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertGreater(len(set(date.date() for date in dates)), 1)
+
+
+class ExportImportTest(TestCase):
+    def test_round_trip(self):
+        """import_posts восстанавливает выгрузку export_posts"""
+        call_command('seed_data', users=10, groups=2, posts=50,
+                     comments=80, follows=15, seed=2, stdout=StringIO())
+        dump = StringIO()
+        call_command('export_posts', stdout=dump, stderr=StringIO())
+        texts = sorted(Post.objects.values_list('text', 'pub_date'))
+        comments = Comment.objects.count()
+        follows = set(Follow.objects.values_list(
+            'user__username', 'author__username'))
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        Group.objects.all().delete()
+
+        dump.seek(0)
+        output = StringIO()
+        call_command('import_posts', stdin=dump, batch_size=16, stdout=output)
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', 'pub_date')), texts)
+        self.assertEqual(Comment.objects.count(), comments)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(set(Follow.objects.values_list(
+            'user__username', 'author__username')), follows)
+        self.assertIn('строк/с', output.getvalue())
+        self.assertEqual(
+            sum(UserStats.objects.values_list('posts_count', flat=True)), 50)
+
+        # Повторный импорт ничего не дублирует
+        dump.seek(0)
+        call_command('import_posts', stdin=dump, stdout=StringIO())
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Follow.objects.count(), len(follows))
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertEqual(Comment.objects.count(), comments)
+
+    def test_import_reports_orphan_comments(self):
+        """Комментарии к постам не из выгрузки видны в отчёте"""
+        dump = StringIO(''.join(json.dumps(record) + '\n' for record in (
+            {'model': 'post', 'id': 1, 'author': 'importer', 'text': 'Пост'},
+            {'model': 'comment', 'post': 1, 'author': 'importer',
+             'text': 'К посту'},
+            {'model': 'comment', 'post': 2, 'author': 'importer',
+             'text': 'Без поста'},
+        )))
+        output = StringIO()
+        call_command('import_posts', stdin=dump, stdout=output)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertIn('Комментарии: 1', output.getvalue())
+        self.assertIn('пропущено 1', output.getvalue())
+        self.assertIn('Комментариев к постам не из выгрузки: 1',
+                      output.getvalue())
+
+    def test_import_counts_image_references(self):
+        """Импорт учитывает ссылки на картинки без сигналов bulk_create"""
+        User.objects.create_user(username='importer')
+        dump = StringIO(''.join(
+            json.dumps({'model': 'post', 'author': 'importer', 'text': text,
+                        'image': 'posts/ab/cd/abcd.gif'}) + '\n'
+            for text in ('Первый', 'Второй')))
+        call_command('import_posts', stdin=dump, stdout=StringIO())
+        self.assertEqual(
+            StoredImage.objects.get(name='posts/ab/cd/abcd.gif').references,
+            2)
+
@@ -1,13 +1,21 @@
+import hashlib
+from io import StringIO
+from unittest import mock
+import os
 import shutil
 import tempfile
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
-from ..models import Post, Group, Comment
+from core.storage import content_name
+
+from .. import caching, thumbnails
+from ..models import Post, Group, Comment, StoredImage
 
 
 User = get_user_model()
@@ -21,6 +29,14 @@ TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 # временная папка TEMP_MEDIA_ROOT, а потом мы ее удалим
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateFormTests(TestCase):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x01\x00'
+        b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+        b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+        b'\x00\x00\x01\x00\x01\x00\x00\x02'
+        b'\x02\x4c\x01\x00\x3b'
+    )
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -147,10 +163,102 @@ class PostCreateFormTests(TestCase):
         self.assertTrue(Post.objects.filter(
             text='Тестовый текст',
             group=self.group.id,
-            image='posts/small.gif',
+            image=content_name(
+                'posts', hashlib.sha256(small_gif).hexdigest(), '.gif'),
             ).exists()
         )
 
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_thumbnails_generated_after_upload(self):
+        """Миниатюры готовятся после загрузки и попадают в Post.thumbnails"""
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x01\x00'
+            b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+            b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+            b'\x00\x00\x01\x00\x01\x00\x00\x02'
+            b'\x02\x4c\x01\x00\x3b'
+        )
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=small_gif,
+            content_type='image/gif'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост с миниатюрой', 'image': uploaded},
+            )
+        post = Post.objects.get(text='Пост с миниатюрой')
+        self.assertIn('card', post.thumbnails)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, post.thumbnails['card'])
+
+    def test_thumbnails_backfilled_and_cropped_meanwhile(self):
+        """Пост без миниатюр показывает обрезку sorl, команда их готовит"""
+        post = Post.objects.create(
+            author=self.user, text='Пост без миниатюр',
+            image=SimpleUploadedFile('old.gif', self.small_gif,
+                                     content_type='image/gif'))
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, post.image.url)
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+        output = StringIO()
+        call_command('backfill_thumbnails', stdout=output)
+        self.assertIn('Миниатюры готовы: 1', output.getvalue())
+        post.refresh_from_db()
+        self.assertIn('card', post.thumbnails)
+        self.assertFalse(thumbnails.missing().filter(pk=post.pk).exists())
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_failed_thumbnails_retried(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост с ошибкой миниатюры',
+            image=SimpleUploadedFile('bad.gif', self.small_gif,
+                                     content_type='image/gif'))
+        with mock.patch.object(thumbnails, 'get_thumbnail',
+                               side_effect=OSError), \
+                mock.patch.object(thumbnails.threading, 'Timer') as timer, \
+                self.assertLogs(thumbnails.logger):
+            self.assertFalse(thumbnails.generate(post.pk, post.image.name))
+            timer.assert_called_once_with(
+                thumbnails.RETRY_DELAY, thumbnails._submit,
+                (post.pk, post.image.name, 2))
+            timer.reset_mock()
+            thumbnails.generate(post.pk, post.image.name,
+                                attempt=thumbnails.ATTEMPTS)
+            timer.assert_not_called()
+
+    def test_thumbnails_of_replaced_image_dropped(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост со старой картинкой',
+            image=SimpleUploadedFile('first.gif', self.small_gif,
+                                     content_type='image/gif'))
+        old_image = post.image.name
+        post.image = SimpleUploadedFile('second.gif', self.small_gif + b'!',
+                                        content_type='image/gif')
+        post.save()
+        self.assertFalse(thumbnails.generate(post.pk, old_image))
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnails, {})
+
+    def test_thumbnails_keep_feed_generations(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост без миниатюр', group=self.group,
+            image=SimpleUploadedFile('feed.gif', self.small_gif,
+                                     content_type='image/gif'))
+        scopes = (caching.GLOBAL, caching.INDEX,
+                  caching.group_scope(self.group.pk),
+                  caching.author_scope(self.user.pk))
+        versions = caching.scope_versions(*scopes)
+        updated = post.updated
+        self.assertTrue(thumbnails.generate(post.pk, post.image.name))
+        self.assertEqual(caching.scope_versions(*scopes), versions)
+        post.refresh_from_db()
+        self.assertIn('card', post.thumbnails)
+        self.assertGreater(post.updated, updated)
+
     def test_comment_post_guest_user(self):
         """Неавторизованный пользователь не может комментировать посты"""
         post = Post.objects.create(
@@ -172,3 +280,111 @@ class PostCreateFormTests(TestCase):
             text=form_data['text']).exists())
         self.assertRedirects(response, f'/auth/login/?next=/posts/{post.id}/comment/')
         self.assertNotEqual(Comment.objects.count(), comment_count + 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class StoredImageTests(TestCase):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x01\x00'
+        b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+        b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+        b'\x00\x00\x01\x00\x01\x00\x00\x02'
+        b'\x02\x4c\x01\x00\x3b'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+        cls.name = content_name(
+            'posts', hashlib.sha256(cls.small_gif).hexdigest(), '.gif')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, text, filename):
+        uploaded = SimpleUploadedFile(filename, self.small_gif,
+                                      content_type='image/gif')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('posts:post_create'),
+                             data={'text': text, 'image': uploaded})
+        return Post.objects.get(text=text)
+
+    def path(self):
+        return os.path.join(TEMP_MEDIA_ROOT, self.name)
+
+    def references(self):
+        image = StoredImage.objects.filter(name=self.name).first()
+        return image and image.references
+
+    def test_same_content_stored_once(self):
+        first = self.upload('Первая копия', 'one.gif')
+        second = self.upload('Вторая копия', 'two.GIF')
+        self.assertEqual(first.image.name, self.name)
+        self.assertEqual(second.image.name, self.name)
+        digest = hashlib.sha256(self.small_gif).hexdigest()
+        self.assertEqual(self.name,
+                         f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif')
+        self.assertEqual(os.listdir(os.path.dirname(self.path())),
+                         [os.path.basename(self.name)])
+        self.assertEqual(self.references(), 2)
+        # Миниатюра одна на оба поста
+        self.assertEqual(first.thumbnails, second.thumbnails)
+
+    def test_last_reference_deletes_file(self):
+        first = self.upload('Первая копия', 'one.gif')
+        second = self.upload('Вторая копия', 'two.gif')
+        thumbnail = os.path.join(
+            TEMP_MEDIA_ROOT,
+            first.thumbnails['card'].removeprefix(settings.MEDIA_URL))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.references(), 1)
+        self.assertTrue(os.path.exists(self.path()))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertIsNone(self.references())
+        self.assertFalse(os.path.exists(self.path()))
+        self.assertFalse(os.path.exists(thumbnail))
+
+    def test_clearing_image_releases_reference(self):
+        post = self.upload('Пост с картинкой', 'one.gif')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={'text': post.text, 'image-clear': 'on'})
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertIsNone(self.references())
+        self.assertFalse(os.path.exists(self.path()))
+
+    def test_reconcile_restores_references(self):
+        self.upload('Пост с картинкой', 'one.gif')
+        StoredImage.objects.all().delete()
+        StoredImage.objects.reconcile()
+        self.assertEqual(self.references(), 1)
+
+    def test_reconcile_counters_keeps_files(self):
+        post = self.upload('Пост с картинкой', 'one.gif')
+        # Пост потерял картинку в обход сигналов
+        Post.objects.filter(pk=post.pk).update(image='')
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.references(), 0)
+        self.assertTrue(os.path.exists(self.path()))
+
+    def test_collect_images_command(self):
+        post = self.upload('Пост с картинкой', 'one.gif')
+        Post.objects.filter(pk=post.pk).update(image='')
+        output = StringIO()
+        call_command('collect_images', dry_run=True, stdout=output)
+        self.assertIn(self.name, output.getvalue())
+        self.assertTrue(os.path.exists(self.path()))
+        call_command('collect_images', stdout=StringIO())
+        self.assertFalse(os.path.exists(self.path()))
+        self.assertIsNone(self.references())
+
@@ -0,0 +1,83 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Строки плана SQLite, означающие полный проход или сортировку в памяти
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+class QueryPlanTest(TestCase):
+    """Запросы страниц ленты обходятся индексами, без сканов и сортировок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='plan_author')
+        cls.reader = User.objects.create_user(username='plan_reader')
+        cls.group = Group.objects.create(
+            title='Группа плана', slug='plan-slug', description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(30):
+            post = Post.objects.create(
+                author=cls.author if i % 2 else cls.reader,
+                group=cls.group if i % 3 else None,
+                text=f'Пост {i}',
+            )
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text=f'Комментарий {i}')
+        cls.post = post
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def _plans(self, url, **params):
+        queries = []
+
+        def capture(execute, sql, sql_params, many, context):
+            queries.append((sql, sql_params))
+            return execute(sql, sql_params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, sql_params in queries:
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', sql_params)
+                plans.append((sql, [row[3] for row in cursor.fetchall()]))
+        return response, plans
+
+    def _assert_indexed(self, url, **params):
+        response, plans = self._plans(url, **params)
+        for sql, details in plans:
+            for detail in details:
+                with self.subTest(url=url, sql=sql, plan=detail):
+                    self.assertIsNone(FULL_SCAN.match(detail))
+                    self.assertNotIn(TEMP_SORT, detail)
+        return response
+
+    def test_feed_queries_use_indexes(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            response = self._assert_indexed(url)
+            page_obj = response.context.get('page_obj')
+            if page_obj is not None and page_obj.has_next:
+                self._assert_indexed(url, after=page_obj.next_cursor)
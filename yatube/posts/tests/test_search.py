@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Post
+from ..search import filter_queryset
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+        cls.match = Post.objects.create(
+            author=cls.user, text='Кошки спят, кошки едят, кошки мурлычут')
+        cls.weak_match = Post.objects.create(
+            author=cls.user,
+            text='Длинный рассказ про собак, в конце появляется кошки след')
+        cls.other = Post.objects.create(author=cls.user, text='Про собак')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_search_ranks_by_bm25(self):
+        """Поиск находит посты и ставит более релевантные выше"""
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'кошки'})
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.match, self.weak_match])
+        self.assertTemplateUsed(response, 'posts/includes/text_post.html')
+
+    def test_search_sees_updates(self):
+        """Индекс следует за изменением текста, в том числе через update()"""
+        Post.objects.filter(pk=self.other.pk).update(text='Про хомяков')
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'хомяков'})
+        self.assertEqual(list(response.context['page_obj']), [self.other])
+
+    def test_search_ignores_fts_syntax(self):
+        """Операторы FTS5 во вводе не ломают поиск"""
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': 'кошки" OR NEAR('})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_search_pagination(self):
+        """Выдача листается курсором по рангу"""
+        Post.objects.bulk_create(
+            [Post(author=self.user, text=f'Кошки номер {i}')
+             for i in range(12)])
+        url = reverse('posts:search')
+        first_page = self.guest_client.get(url, {'q': 'кошки'}).context[
+            'page_obj']
+        second_page = self.guest_client.get(
+            url, {'q': 'кошки', 'after': first_page.next_cursor}).context[
+            'page_obj']
+        seen = [post.pk for post in first_page] + [
+            post.pk for post in second_page]
+        self.assertEqual(len(seen), 14)
+        self.assertEqual(len(set(seen)), 14)
+        self.assertIn('q=', second_page.previous_url)
+
+    def test_filter_queryset(self):
+        """Поиск в админке ограничивает queryset через индекс"""
+        self.assertEqual(
+            list(filter_queryset(Post.objects.all(), 'мурлычут')),
+            [self.match])
@@ -1,3 +1,6 @@
+from io import StringIO
+import hashlib
+from unittest import mock, skipIf
 import shutil
 import tempfile
 
@@ -5,11 +8,19 @@ from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django import forms
 
-from ..models import Group, Post, Follow
+from core.storage import content_name
+
+from .. import caching, follow_graph, pull_feed
+from ..models import Comment, Group, Post, Follow, TimelineEntry
+from ..utils import ORDERING
 
 User = get_user_model()
 
@@ -35,6 +46,9 @@ class PostPagesTests(TestCase):
             content=small_gif,
             content_type='image/gif'
         )
+        # Картинка хранится под хешем содержимого
+        cls.image_name = content_name(
+            'posts', hashlib.sha256(small_gif).hexdigest(), '.gif')
 
         cls.user = User.objects.create_user(username='auth')
         cls.group = Group.objects.create(
@@ -94,7 +108,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(post_text_0, 'Тестовый пост')
         self.assertEqual(post_author_0, 'auth')
         self.assertEqual(post_group_0, 'Тестовая группа')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.image_name)
 
     def test_group_pages_show_correct_context(self):
         """Шаблон group_list сформирован с правильным контекстом."""
@@ -105,7 +119,7 @@ class PostPagesTests(TestCase):
         post_image_0 = Post.objects.first().image
         self.assertEqual(group_title_0, 'Тестовая группа')
         self.assertEqual(group_slug_0, 'test-slug')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.image_name)
 
     def test_profile_correct_context(self):
         """Шаблон profile сформирован с правильным контекстом"""
@@ -117,7 +131,7 @@ class PostPagesTests(TestCase):
         post_image_0 = Post.objects.first().image
         self.assertEqual(post_text_0, 'Тестовый пост')
         self.assertEqual(user_0, 'auth')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.image_name)
 
     def test_post_detail_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом"""
@@ -127,7 +141,7 @@ class PostPagesTests(TestCase):
         post_text_0 = obj.text
         post_image_0 = Post.objects.first().image
         self.assertEqual(post_text_0, 'Тестовый пост')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.image_name)
 
     def test_post_create_correct_context(self):
         """Шаблон post_create сформирован с правильным контекстом"""
@@ -209,14 +223,167 @@ class PaginatorViewsTest(TestCase):
 
     def test_second_page_contains_three_records(self):
         urls = [
-            reverse('posts:index') + '?page=2',
-            reverse('posts:group_list', kwargs={'slug': 'test-slug3'}) + '?page=2',
-            reverse('posts:profile', kwargs={'username': 'auth3'}) + '?page=2',
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug3'}),
+            reverse('posts:profile', kwargs={'username': 'auth3'}),
         ]
         for test in urls:
-            response = self.client.get(test)
+            first_page = self.client.get(test).context['page_obj']
+            response = self.client.get(test, {'after': first_page.next_cursor})
             self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_previous_page_returns_first_page(self):
+        """Ссылка «Новее» со второй страницы возвращает первую"""
+        url = reverse('posts:index')
+        first_page = self.client.get(url).context['page_obj']
+        second_page = self.client.get(
+            url, {'after': first_page.next_cursor}).context['page_obj']
+        self.assertTrue(second_page.has_previous)
+        self.assertFalse(second_page.has_next)
+        response = self.client.get(
+            url, {'before': second_page.previous_cursor})
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [post.pk for post in first_page],
+        )
+        self.assertFalse(response.context['page_obj'].has_previous)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый токен курсора не ломает страницу"""
+        response = self.client.get(reverse('posts:index'), {'after': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class ElidedPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='pager')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.author) for i in range(55))
+        cls.ordered = list(Post.objects.order_by(*ORDERING))
+        cls.url = reverse('posts:index')
+
+    def setUp(self):
+        cache.clear()
+
+    def labels(self, page_obj):
+        return [link.label for link in page_obj.elided_range()]
+
+    def test_first_page_shows_window_and_last(self):
+        page_obj = self.client.get(self.url).context['page_obj']
+        self.assertEqual(self.labels(page_obj), [1, 2, 3, '…', 6])
+        self.assertTrue(page_obj.elided_range()[0].current)
+
+    def test_window_link_skips_pages(self):
+        first = self.client.get(self.url).context['page_obj']
+        third_link = first.elided_range()[2]
+        page_obj = self.client.get(self.url + third_link.url).context[
+            'page_obj']
+        self.assertEqual(list(page_obj), self.ordered[20:30])
+        self.assertEqual(self.labels(page_obj), [1, 2, 3, 4, 5, 6])
+        # И обратно через одну страницу
+        back = page_obj.elided_range()[0]
+        page_obj = self.client.get(self.url + back.url).context['page_obj']
+        self.assertEqual(list(page_obj), self.ordered[:10])
+        self.assertEqual(page_obj.number, 1)
+
+    def test_last_page(self):
+        first = self.client.get(self.url).context['page_obj']
+        page_obj = self.client.get(self.url + first.last_url).context[
+            'page_obj']
+        # Остаток, а не последние десять: страницы не пересекаются
+        self.assertEqual(list(page_obj), self.ordered[50:])
+        self.assertFalse(page_obj.has_next)
+        self.assertEqual(page_obj.number, 6)
+        previous = self.client.get(self.url + page_obj.previous_url).context[
+            'page_obj']
+        self.assertEqual(list(previous), self.ordered[40:50])
+        self.assertEqual(previous.number, 5)
+        # Без page в адресе номер тот же
+        page_obj = self.client.get(self.url, {'last': ''}).context['page_obj']
+        self.assertEqual(page_obj.number, 6)
+
+    def test_forged_page_number_ignored(self):
+        first = self.client.get(self.url).context['page_obj']
+        response = self.client.get(
+            self.url, {'after': first.next_cursor, 'page': '99999'})
+        page_obj = response.context['page_obj']
+        self.assertIsNone(page_obj.number)
+        self.assertNotContains(response, '99999')
+        second = self.client.get(self.url + first.next_url).context[
+            'page_obj']
+        self.assertEqual(second.number, 2)
+
+    def test_count_cached_between_requests(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']])
+
+    def test_markup_does_not_grow_with_feed(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.content.decode().count('page-item'), 6)
+
+
+@skipIf(settings.POSTS_ASYNC_VIEWS, 'потоковые ответы только у sync')
+@override_settings(POSTS_STREAMING_VIEWS=True)
+class StreamingFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='streamer')
+        cls.group = Group.objects.create(title='Поток', slug='stream',
+                                         description='Группа потока')
+        Post.objects.bulk_create(
+            Post(text=f'Потоковый пост {i}', author=cls.author,
+                 group=cls.group)
+            for i in range(12))
+        Follow.objects.create(
+            user=User.objects.create_user(username='stream_reader'),
+            author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_head_sent_before_feed_query(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertTrue(response.streaming)
+        chunks = iter(response.streaming_content)
+        with CaptureQueriesContext(connection) as queries:
+            head = next(chunks).decode()
+        self.assertIn('</head>', head)
+        self.assertNotIn('Потоковый пост', head)
+        self.assertFalse(
+            [query for query in queries if 'posts_post' in query['sql']])
+        body = head + b''.join(chunks).decode()
+        expected = Post.objects.order_by(*ORDERING)[:10]
+        positions = [body.index(post.text + '<') for post in expected]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn('Старее', body)
+
+    def test_cards_streamed_one_by_one(self):
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}))
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        cards = [chunk for chunk in chunks if 'Потоковый пост' in chunk]
+        self.assertEqual(len(cards), 10)
+
+    def test_errors_decided_before_streaming(self):
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_follow_feed(self):
+        self.client.force_login(User.objects.get(username='stream_reader'))
+        response = self.client.get(reverse('posts:follow_index'))
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('Потоковый пост'), 10)
+
 
 class CacheTest(TestCase):
     @classmethod
@@ -232,14 +399,160 @@ class CacheTest(TestCase):
         self.guest_client = Client()
 
     def test_index_cache(self):
-        """Страница index правильно кешируется"""
+        """Страница index кешируется до изменения ленты"""
         response = self.guest_client.get(reverse('posts:index'))
+        # update() не шлёт сигналов, поэтому фрагмент остаётся в кеше
+        Post.objects.filter(pk=self.post.pk).update(text='Изменено молча')
+        cached_response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(response.content, cached_response.content)
         self.post.delete()
         response_after_delete_post = self.guest_client.get(reverse('posts:index'))
-        self.assertEqual(response.content, response_after_delete_post.content)
-        cache.clear()
-        non_cached_response = self.guest_client.get(reverse('posts:index'))
-        self.assertNotEqual(response.content, non_cached_response.content)
+        self.assertNotEqual(response.content, response_after_delete_post.content)
+
+    def test_group_cache_invalidated_on_new_post(self):
+        """Новый пост сразу виден в закешированной ленте группы"""
+        group = Group.objects.create(title='Кеш', slug='cache-slug',
+                                     description='Группа для кеша')
+        url = reverse('posts:group_list', kwargs={'slug': group.slug})
+        self.guest_client.get(url)
+        Post.objects.create(author=self.author, text='Пост в группе',
+                            group=group)
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Пост в группе')
+
+    def test_post_card_cached_across_feeds(self):
+        """Карточка поста переиспользуется разными лентами до правки поста"""
+        post = Post.objects.create(author=self.author, text='Карточка в кеше')
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=post.pk).update(text='Изменено молча')
+        # Новый пост сбрасывает ленту автора, но не карточку старого поста
+        Post.objects.create(author=self.author, text='Соседний пост')
+        profile_url = reverse('posts:profile',
+                              kwargs={'username': self.author.username})
+        response = self.guest_client.get(profile_url)
+        self.assertContains(response, 'Карточка в кеше')
+        post.refresh_from_db()
+        post.save()
+        response = self.guest_client.get(profile_url)
+        self.assertContains(response, 'Изменено молча')
+
+    def test_post_card_follows_group_and_author(self):
+        """Правка группы или имени автора обновляет карточки в лентах"""
+        group = Group.objects.create(title='Старая', slug='old-slug',
+                                     description='Группа карточки')
+        Post.objects.create(author=self.author, text='Пост группы',
+                            group=group)
+        other = User.objects.create_user(username='cache_other')
+        other_post = Post.objects.create(author=other, text='Чужая карточка')
+        url = reverse('posts:index')
+        self.assertContains(self.guest_client.get(url), '/group/old-slug/')
+        # Вход пользователя карточки не сбрасывает
+        version = caching.feed_version()
+        self.author.last_login = timezone.now()
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(caching.feed_version(), version)
+        Post.objects.filter(pk=other_post.pk).update(text='Изменено молча')
+        group.slug = 'new-slug'
+        group.save()
+        self.author.first_name = 'Новое'
+        self.author.last_name = 'Имя'
+        self.author.save()
+        response = self.guest_client.get(url)
+        self.assertContains(response, '/group/new-slug/')
+        self.assertNotContains(response, '/group/old-slug/')
+        self.assertContains(response, 'Новое Имя')
+        # Карточки других авторов и общее поколение не тронуты
+        self.assertContains(response, 'Чужая карточка')
+        self.assertEqual(caching.feed_version(), version)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='etag_author')
+        self.reader = User.objects.create_user(username='etag_reader')
+        self.post = Post.objects.create(author=self.author, text='Пост с ETag')
+        self.client = Client()
+
+    def _revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_feed_returns_304_without_queries(self):
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        with self.assertNumQueries(0):
+            cached = self._revalidate(url, response)
+        self.assertEqual(cached.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self._revalidate(url, response).status_code, 200)
+
+    def test_new_comment_changes_post_etag(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        self.assertEqual(self._revalidate(url, response).status_code, 304)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        self.assertEqual(self._revalidate(url, response).status_code, 200)
+
+    def test_follow_changes_profile_etag(self):
+        url = reverse('posts:profile',
+                      kwargs={'username': self.author.username})
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertEqual(self._revalidate(url, response).status_code, 304)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self._revalidate(url, response).status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.client.force_login(self.reader)
+        self.assertEqual(self._revalidate(url, response).status_code, 200)
+
+    def test_new_login_changes_post_etag(self):
+        """Форма с токеном прошлого входа не отдаётся из кеша браузера"""
+        self.reader.set_password('etag-pass')
+        self.reader.save()
+        client = Client(enforce_csrf_checks=True)
+
+        def login():
+            form = client.get(reverse('users:login'))
+            client.post(reverse('users:login'), {
+                'username': 'etag_reader', 'password': 'etag-pass',
+                'csrfmiddlewaretoken': form.context['csrf_token']})
+
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        login()
+        response = client.get(url)
+        cached = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        client.get(reverse('users:logout'))
+        login()
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'После нового входа',
+             'csrfmiddlewaretoken': response.context['csrf_token']})
+        self.assertTrue(Comment.objects.filter(
+            text='После нового входа').exists())
+
+    def test_group_change_changes_post_etag(self):
+        group = Group.objects.create(title='Группа поста', slug='etag-group')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        self.assertEqual(self._revalidate(url, response).status_code, 304)
+        group.title = 'Новое название'
+        group.save()
+        self.assertEqual(self._revalidate(url, response).status_code, 200)
+        caching.bump(caching.group_scope(group.pk))
+        self.assertNotEqual(self.client.get(url)['ETag'], response['ETag'])
+
+    def test_anonymous_follow_index_redirects(self):
+        response = self.client.get(reverse('posts:follow_index'),
+                                   HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 302)
 
 
 class FollowTest(TestCase):
@@ -272,4 +585,170 @@ class FollowTest(TestCase):
         post_test_0 = response.context['page_obj'][0].text
         self.assertEqual(post_test_0, self.post.text)
         response = self.client_following.get(reverse('posts:follow_index'))
-        self.assertNotEqual(response.context, self.post.text)
\ No newline at end of file
+        self.assertNotEqual(response.context, self.post.text)
+
+    def test_new_post_pushed_to_follower_timeline(self):
+        """Новый пост автора попадает в ленту подписчика"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        new_post = Post.objects.create(text='Свежий пост',
+                                       author=self.user_following)
+        response = self.client_follower.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+    def test_unfollow_trims_timeline(self):
+        """После отписки посты автора пропадают из ленты"""
+        self.client_follower.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.user_following.username}))
+        self.client_follower.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user_following.username}))
+        response = self.client_follower.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленту"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', self.user_follower.username,
+                     stdout=StringIO())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user_follower, post=self.post).exists())
+
+    def test_profile_following_state_from_cached_set(self):
+        """Кнопка подписки читает кешированное множество, а не Follow"""
+        profile_url = reverse(
+            'posts:profile', kwargs={'username': self.user_following.username})
+        self.client_follower.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.user_following.username}))
+        self.assertTrue(
+            self.client_follower.get(profile_url).context['following'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client_follower.get(profile_url)
+        self.assertFalse(
+            [query for query in queries if 'posts_follow' in query['sql']])
+        self.client_follower.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user_following.username}))
+        self.assertFalse(
+            self.client_follower.get(profile_url).context['following'])
+        self.assertEqual(
+            list(follow_graph.followees(self.user_follower.pk)), [])
+
+    def test_followee_sets_expire(self):
+        """Массивы подписок прошлых поколений не остаются в кеше навсегда"""
+        with mock.patch.object(follow_graph.cache, 'get',
+                               return_value=None), \
+                mock.patch.object(follow_graph.cache, 'set') as cache_set:
+            follow_graph.followees(self.user_follower.pk)
+        self.assertEqual(cache_set.call_args.args[2], follow_graph.TIMEOUT)
+
+
+@override_settings(FOLLOW_FEED_STRATEGY='pull')
+class PullFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='puller')
+        cls.authors = [User.objects.create_user(username=f'pulled{i}')
+                       for i in range(3)]
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.authors[i % 3])
+            for i in range(30))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.url = reverse('posts:follow_index')
+
+    def expected(self):
+        return list(Post.objects.filter(
+            author__in=self.authors[:2]).order_by(*ORDERING))
+
+    def walk(self):
+        """Все страницы вперёд, затем обратно до первой."""
+        pages = [self.client.get(self.url).context['page_obj']]
+        while pages[-1].has_next:
+            pages.append(self.client.get(
+                self.url, {'after': pages[-1].next_cursor}).context['page_obj'])
+        page_obj = pages[-1]
+        back = []
+        while page_obj.has_previous:
+            page_obj = self.client.get(
+                self.url, {'before': page_obj.previous_cursor}
+            ).context['page_obj']
+            back.append(list(page_obj))
+        return [post for page_obj in pages for post in page_obj], back
+
+    def test_merge_matches_feed_order(self):
+        posts, back = self.walk()
+        self.assertEqual(posts, self.expected())
+        self.assertEqual(back[-1], self.expected()[:10])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_deep_pages_fall_back_to_query(self):
+        with mock.patch.object(pull_feed, 'RECENT_PER_AUTHOR', 8):
+            posts, back = self.walk()
+        self.assertEqual(posts, self.expected())
+        self.assertEqual(back[-1], self.expected()[:10])
+
+    def test_new_post_visible_without_fan_out(self):
+        self.client.get(self.url)
+        post = Post.objects.create(text='Свежий', author=self.authors[0])
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['page_obj'][0], post)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_page_hydrates_only_shown_posts(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        sql = [query['sql'] for query in queries]
+        self.assertFalse([query for query in sql if 'posts_follow' in query])
+        self.assertEqual(len([query for query in sql
+                              if 'FROM "posts_post"' in query]), 1)
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text='Обсуждение')
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(45)
+        ])
+
+    def test_post_detail_renders_first_page_only(self):
+        """На странице поста выводится только первая страница комментариев"""
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertTrue(comments.has_next)
+        self.assertContains(response, reverse(
+            'posts:comments', kwargs={'post_id': self.post.pk}))
+
+    def test_comment_pages_cover_thread(self):
+        """Фрагменты комментариев по курсору проходят весь тред без повторов"""
+        url = reverse('posts:comments', kwargs={'post_id': self.post.pk})
+        seen, cursor = [], None
+        while True:
+            params = {'format': 'json'}
+            if cursor:
+                params['after'] = cursor
+            data = self.client.get(url, params).json()
+            seen += [comment['id'] for comment in data['comments']]
+            cursor = data['next']
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+
+    def test_comment_fragment_uses_template(self):
+        response = self.client.get(reverse(
+            'posts:comments', kwargs={'post_id': self.post.pk}))
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertNotContains(response, '<html')
@@ -0,0 +1,121 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Все размеры из settings.POST_THUMBNAILS генерируются после сохранения
+поста в пуле потоков, а их URL сохраняются в Post.thumbnails, поэтому
+шаблоны не обращаются к PIL во время запроса. Одинаковые картинки
+лежат в одном файле (core.storage), а sorl находит готовую миниатюру
+по имени исходника, поэтому повторная загрузка ничего не генерирует.
+
+Неудачная генерация повторяется с паузой до ATTEMPTS раз. Всё, что
+осталось без миниатюр (старые и импортированные посты, задачи,
+потерянные при перезапуске), догоняет команда backfill_thumbnails, а
+шаблоны до тех пор режут картинку тегом sorl.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from core import metrics
+
+from . import caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Попыток на пост и пауза перед первым повтором, секунды; дальше вдвое
+ATTEMPTS = 3
+RETRY_DELAY = 5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def missing(queryset=None):
+    """Посты с картинкой, у которых нет какой-то из POST_THUMBNAILS."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    return queryset.exclude(image='').exclude(
+        thumbnails__has_keys=list(settings.POST_THUMBNAILS))
+
+
+def generate(post_id, image, attempt=1):
+    """Готовит миниатюры картинки image поста и сохраняет их URL.
+
+    Если картинку успели заменить, результат выбрасывается: новую
+    готовит своя задача.
+    """
+    # Задача ставится сразу после коммита: реплика может отставать
+    post = Post.objects.using(router.db_for_write(Post)).filter(
+        pk=post_id, image=image).first()
+    if post is None:
+        return False
+    thumbnails = {}
+    if post.image:
+        started = time.perf_counter()
+        try:
+            for name, (geometry, options) in settings.POST_THUMBNAILS.items():
+                thumbnails[name] = get_thumbnail(
+                    post.image, geometry, **options).url
+        except Exception:
+            logger.exception('Не удалось подготовить миниатюры поста %s '
+                             '(попытка %s)', post_id, attempt)
+            _retry(post_id, image, attempt)
+            return False
+        metrics.observe('yatube_thumbnail_generation_seconds',
+                        time.perf_counter() - started)
+    # Не save(): его сигналы сбросили бы ленты всего сайта, а меняется
+    # только карточка этого поста (её ключ включает updated)
+    if not Post.objects.filter(pk=post_id, image=image).update(
+            thumbnails=thumbnails, updated=timezone.now()):
+        return False
+    caching.bump(caching.post_scope(post_id))
+    return True
+
+
+def _retry(post_id, image, attempt):
+    # Без пула повторять некому: пост дождётся backfill_thumbnails
+    if attempt >= ATTEMPTS or not settings.THUMBNAIL_WORKERS:
+        return
+    timer = threading.Timer(RETRY_DELAY * 2 ** (attempt - 1), _submit,
+                            (post_id, image, attempt + 1))
+    timer.daemon = True
+    timer.start()
+
+
+def _run(post_id, image, attempt):
+    try:
+        generate(post_id, image, attempt)
+    finally:
+        metrics.inc('yatube_thumbnail_queue_size', -1)
+        # У каждого потока пула свои соединения с базами
+        connections.close_all()
+
+
+def _submit(post_id, image, attempt=1):
+    metrics.inc('yatube_thumbnail_queue_size')
+    _get_executor().submit(_run, post_id, image, attempt)
+
+
+def schedule(post):
+    """Ставит подготовку миниатюр в очередь после фиксации транзакции."""
+    post_id, image = post.pk, post.image.name or ''
+    if settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: _submit(post_id, image))
+    else:
+        transaction.on_commit(lambda: generate(post_id, image))
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import transaction
+
+from .models import Follow, Post, TimelineEntry
+
+BATCH_SIZE = 1000
+# Порядок ленты подписок; ключи совпадают с utils.ORDERING для Post.
+# post_id, а не post: иначе Django подставит сортировку из Post.Meta
+ORDERING = ('-pub_date', 'author', 'post_id')
+
+
+def enabled():
+    """Ведутся ли ленты TimelineEntry (FOLLOW_FEED_STRATEGY = 'push')."""
+    return settings.FOLLOW_FEED_STRATEGY == 'push'
+
+
+def _entry(user_id, post):
+    return TimelineEntry(user_id=user_id, post_id=post.pk,
+                         author_id=post.author_id, pub_date=post.pub_date)
+
+
+def _insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True)
+    _insert(_entry(user_id, post)
+            for user_id in followers.iterator(chunk_size=BATCH_SIZE))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту посты автора, на которого только что подписались."""
+    posts = Post.objects.filter(author_id=author_id).only(
+        'pk', 'author_id', 'pub_date')
+    _insert(_entry(user_id, post)
+            for post in posts.iterator(chunk_size=BATCH_SIZE))
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя по текущим подпискам."""
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        posts = Post.objects.filter(author__following__user_id=user_id).only(
+            'pk', 'author_id', 'pub_date')
+        _insert(_entry(user_id, post)
+                for post in posts.iterator(chunk_size=BATCH_SIZE))
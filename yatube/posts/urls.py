@@ -1,19 +1,27 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.POSTS_ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
+
 
 app_name = 'posts'
 
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('group/<slug:slug>/', views.groups_posts, name='group_list'),
-    path('profile/<str:username>/', views.profile, name='profile'),
-    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('', read_views.index, name='index'),
+    path('search/', views.post_search, name='search'),
+    path('group/<slug:slug>/', read_views.groups_posts, name='group_list'),
+    path('profile/<str:username>/', read_views.profile, name='profile'),
+    path('posts/<int:post_id>/', read_views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/', views.add_comment, name='add_comment'),
-    path('follow/', views.follow_index, name='follow_index'),
+    path('posts/<int:post_id>/comments/', views.post_comments, name='comments'),
+    path('follow/', read_views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
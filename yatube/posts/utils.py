@@ -1,11 +1,434 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import contextlib
+import datetime
+import json
+import math
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import QueryDict
+from django.utils.crypto import constant_time_compare, salted_hmac
 
 
 NUM_OF_PAGES = 10
+COMMENTS_PER_PAGE = 20
+# Порядок ленты из Post.Meta плюс pk, чтобы ключ курсора был уникальным
+ORDERING = ('-pub_date', 'author', 'pk')
+COMMENT_ORDERING = ('-created', 'id')
+# Сколько соседних страниц показывать по обе стороны от текущей
+PAGE_WINDOW = 2
+# Сколько секунд живёт оценка размера ленты
+COUNT_TIMEOUT = 300
+
+# Длина подписи номера страницы в параметре page
+PAGE_SIGNATURE = 12
+
+# Пункт навигации; у многоточия и текущей страницы нет ссылки
+PageLink = namedtuple('PageLink', ('label', 'url', 'current'))
+
+
+def _json_default(value):
+    # DjangoJSONEncoder обрезает микросекунды, а ключу нужна точность
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    raw = json.dumps(values, default=_json_default).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора; для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _position(after=None, before=None):
+    if after:
+        return f'after:{after}'
+    return f'before:{before}' if before else ''
+
+
+def _page_signature(number, position, skip):
+    raw = f'{number}:{position}:{skip or 0}'
+    return salted_hmac('posts.utils.page', raw).hexdigest()[:PAGE_SIGNATURE]
+
+
+def signed_number(number, after=None, before=None, skip=None):
+    """Значение параметра page: номер с подписью, привязанной к курсору."""
+    position = _position(after, before)
+    return f'{number}.{_page_signature(number, position, skip)}'
+
+
+def verified_number(params):
+    """Номер страницы из параметров, если подпись сходится, иначе None."""
+    position = _position(params.get('after'), params.get('before'))
+    if not position:
+        return 1
+    number, _, signature = params.get('page', '').partition('.')
+    number = _positive(number, None)
+    if number is None:
+        return None
+    expected = _page_signature(number, position,
+                               _positive(params.get('skip'), 0))
+    return number if constant_time_compare(signature, expected) else None
+
+
+class CursorPage:
+    """Страница ленты с токенами соседних страниц вместо номеров.
+
+    Номер страницы приходит в параметре page и служит только подписью:
+    переходы идут по курсорам, а дальние номера открываются пропуском
+    не больше PAGE_WINDOW страниц от курсора соседней. Номер подписан
+    вместе с курсором, так что подставить в ссылку свой нельзя: без
+    верной подписи страница показывается без номера.
+    """
+
+    def __init__(self, object_list, key, params, has_next, has_previous,
+                 number=None, count=None, per_page=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.params = params
+        self.next_cursor = (
+            encode_cursor(key(object_list[-1])) if has_next else None)
+        self.previous_cursor = (
+            encode_cursor(key(object_list[0])) if has_previous else None)
+        # Без номера (поиск, комментарии) навигация только «Новее/Старее»
+        self.number = number if number is None or has_previous else 1
+        self._count = count
+        self.per_page = per_page or len(object_list) or 1
+
+    def __repr__(self):
+        position = (self.params.get('after') or self.params.get('before')
+                    or ('last' if 'last' in self.params else 'first'))
+        skip = self.params.get('skip')
+        return f'<CursorPage {position}{f" +{skip}" if skip else ""}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _url(self, page=None, **cursor):
+        params = self.params.copy()
+        for name in ('after', 'before', 'page', 'skip', 'last'):
+            params.pop(name, None)
+        cursor = {name: value for name, value in cursor.items()
+                  if value is not None}
+        if page is not None and ('after' in cursor or 'before' in cursor):
+            cursor['page'] = signed_number(page, **{
+                name: value for name, value in cursor.items()
+                if name in ('after', 'before', 'skip')})
+        params.update(cursor)
+        return f'?{params.urlencode()}'
+
+    def _number(self, step):
+        return None if self.number is None else self.number + step
+
+    @property
+    def first_url(self):
+        return self._url()
+
+    @property
+    def next_url(self):
+        return self._url(after=self.next_cursor, page=self._number(1))
+
+    @property
+    def previous_url(self):
+        return self._url(before=self.previous_cursor, page=self._number(-1))
+
+    @property
+    def estimated_count(self):
+        """Оценка размера ленты: денормализованный или кешированный счётчик."""
+        if callable(self._count):
+            self._count = self._count()
+        return self._count
+
+    @property
+    def num_pages(self):
+        if self.estimated_count is None or self.number is None:
+            return None
+        # Оценка могла устареть: не меньше уже известных страниц
+        return max(math.ceil(self.estimated_count / self.per_page),
+                   self.number + self.has_next)
+
+    @property
+    def last_url(self):
+        # Номер последней страницы считается из оценки размера ленты
+        return self._url(last=1)
+
+    def elided_range(self, on_each_side=PAGE_WINDOW):
+        """Первая, последняя и соседние с текущей страницы.
+
+        Число пунктов не зависит от размера ленты.
+        """
+        if self.number is None or not self.has_other_pages():
+            return []
+        links = [PageLink(self.number, None, True)]
+        if self.has_previous:
+            for skip in range(min(on_each_side, self.number - 1)):
+                links.insert(0, PageLink(
+                    self.number - 1 - skip,
+                    self._url(before=self.previous_cursor, skip=skip or None,
+                              page=self.number - 1 - skip),
+                    False))
+        last = self.num_pages
+        if self.has_next:
+            for skip in range(on_each_side):
+                number = self.number + 1 + skip
+                if last is not None and number > last:
+                    break
+                links.append(PageLink(
+                    number,
+                    self._url(after=self.next_cursor, skip=skip or None,
+                              page=number),
+                    False))
+        if links[0].label > 1:
+            if links[0].label > 2:
+                links.insert(0, PageLink('…', None, False))
+            links.insert(0, PageLink(1, self.first_url, False))
+        if self.has_next and last is not None and links[-1].label < last:
+            if links[-1].label < last - 1:
+                links.append(PageLink('…', None, False))
+            links.append(PageLink(last, self.last_url, False))
+        return links
+
+
+class CursorPaginator:
+    """Keyset-пагинация: стоимость страницы не зависит от её глубины.
+
+    Вместо OFFSET и COUNT(*) выбирается per_page + 1 строк после
+    (или до) ключа сортировки последнего показанного объекта.
+    """
+
+    def __init__(self, object_list, per_page, ordering=ORDERING, count=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = ordering
+        # Число объектов или функция, которая его оценит; только для
+        # подписи последней страницы, COUNT(*) по ленте не делается
+        self.count = count
+        opts = object_list.model._meta
+        self.attnames = [
+            'pk' if name == 'pk' else opts.get_field(name).attname
+            for name in (field.lstrip('-') for field in ordering)
+        ]
+
+    def key(self, obj):
+        return [getattr(obj, attname) for attname in self.attnames]
+
+    def _seek(self, values, reverse):
+        """Условие «строго после ключа» для заданного направления."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            step = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], values[:i]):
+                step &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition |= step
+        return condition
+
+    def _slice(self, values, reverse, skip=0, size=None):
+        size = size or self.per_page
+        ordering = self.ordering
+        queryset = self.object_list
+        if reverse:
+            ordering = [_reverse(field) for field in ordering]
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, reverse))
+        offset = skip * self.per_page
+        return queryset.order_by(*ordering)[offset:offset + size + 1]
+
+    def _fetch(self, values, reverse, skip=0, size=None):
+        try:
+            return list(self._slice(values, reverse, skip, size))
+        except (ValidationError, ValueError, TypeError):
+            # Подделанный токен с неприводимыми значениями
+            return []
+
+    async def _afetch(self, values, reverse, skip=0, size=None):
+        try:
+            return [obj async for obj
+                    in self._slice(values, reverse, skip, size)]
+        except (ValidationError, ValueError, TypeError):
+            return []
+
+    def _total(self):
+        if callable(self.count):
+            self.count = self.count()
+        return self.count
+
+    def _last_page(self, rows, size, params):
+        # На последней странице остаток от деления, как при листании
+        # вперёд, иначе она повторяла бы часть предыдущей
+        total = self.count
+        return self._page(rows[:size][::-1], params, has_next=False,
+                          has_previous=len(rows) > size,
+                          number=math.ceil(total / self.per_page)
+                          if total else None)
+
+    def _last_size(self):
+        return self.count % self.per_page if self.count else None
+
+    def _page(self, rows, params, has_next, has_previous, number):
+        return CursorPage(rows, self.key, params, has_next, has_previous,
+                          number, self.count, self.per_page)
+
+    def _valid(self, values):
+        return values is not None and len(values) == len(self.ordering)
+
+    def get_page(self, after=None, before=None, params=None, *, skip=0,
+                 last=False, number=None):
+        params = params if params is not None else QueryDict()
+        after, before = decode_cursor(after), decode_cursor(before)
+        if last:
+            self._total()
+            size = self._last_size() or self.per_page
+            rows = self._fetch(None, reverse=True, size=size)
+            return self._last_page(rows, size, params)
+        if self._valid(before):
+            rows = self._fetch(before, reverse=True, skip=skip)
+            if rows:
+                has_previous = len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+                return self._page(rows, params, has_next=True,
+                                  has_previous=has_previous, number=number)
+        has_previous = self._valid(after)
+        rows = self._fetch(after if has_previous else None, reverse=False,
+                           skip=skip if has_previous else 0)
+        if has_previous and not rows and skip:
+            # Лента короче, чем обещала оценка — берём соседнюю страницу
+            rows = self._fetch(after, reverse=False)
+            if number is not None:
+                number -= skip
+        if has_previous and not rows:
+            # Курсор указывает за конец ленты — показываем первую страницу
+            has_previous = False
+            rows = self._fetch(None, reverse=False)
+        has_next = len(rows) > self.per_page
+        return self._page(rows[:self.per_page], params, has_next=has_next,
+                          has_previous=has_previous, number=number)
+
+    async def aget_page(self, after=None, before=None, params=None, *,
+                        skip=0, last=False, number=None):
+        """Асинхронный вариант get_page для async-представлений."""
+        params = params if params is not None else QueryDict()
+        after, before = decode_cursor(after), decode_cursor(before)
+        if last:
+            await sync_to_async(self._total)()
+            size = self._last_size() or self.per_page
+            rows = await self._afetch(None, reverse=True, size=size)
+            return self._last_page(rows, size, params)
+        if self._valid(before):
+            rows = await self._afetch(before, reverse=True, skip=skip)
+            if rows:
+                has_previous = len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+                return self._page(rows, params, has_next=True,
+                                  has_previous=has_previous, number=number)
+        has_previous = self._valid(after)
+        rows = await self._afetch(after if has_previous else None,
+                                  reverse=False,
+                                  skip=skip if has_previous else 0)
+        if has_previous and not rows and skip:
+            rows = await self._afetch(after, reverse=False)
+            if number is not None:
+                number -= skip
+        if has_previous and not rows:
+            has_previous = False
+            rows = await self._afetch(None, reverse=False)
+        has_next = len(rows) > self.per_page
+        return self._page(rows[:self.per_page], params, has_next=has_next,
+                          has_previous=has_previous, number=number)
+
+
+def _positive(value, default):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def _page_options(request):
+    return {
+        # Пропуск ограничен окном, так что OFFSET не растёт с лентой
+        'skip': min(_positive(request.GET.get('skip'), 0), PAGE_WINDOW),
+        'last': 'last' in request.GET,
+        'number': verified_number(request.GET),
+    }
+
+
+def cached_count(queryset, key):
+    """Ленивая оценка размера ленты: COUNT(*) не чаще раза в COUNT_TIMEOUT."""
+    def count():
+        return cache.get_or_set(
+            f'feed-count:{key}', queryset.count, COUNT_TIMEOUT)
+    return count
+
+
+def page(request, post_list, ordering=ORDERING, count=None):
+    paginator = CursorPaginator(post_list, NUM_OF_PAGES, ordering, count)
+    return paginator.get_page(
+        request.GET.get('after'),
+        request.GET.get('before'),
+        request.GET,
+        **_page_options(request),
+    )
+
+
+async def apage(request, post_list, ordering=ORDERING, count=None):
+    paginator = CursorPaginator(post_list, NUM_OF_PAGES, ordering, count)
+    return await paginator.aget_page(
+        request.GET.get('after'),
+        request.GET.get('before'),
+        request.GET,
+        **_page_options(request),
+    )
+
 
+@contextlib.contextmanager
+def explicit_dates(*models):
+    """Отключает auto_now/auto_now_add, чтобы bulk_create сохранил даты.
 
-def page(request, post_list):
-    paginator = Paginator(post_list, NUM_OF_PAGES)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    Нужно для генерации и импорта данных, где даты уже заданы.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
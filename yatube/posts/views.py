@@ -1,21 +1,62 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils.functional import SimpleLazyObject
+
+from core import streaming
 
 from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Follow
-from .utils import page
+from . import (caching, etags, follow_graph, pull_feed, search, thumbnails,
+               timeline)
+from .models import Group, Post, User, Follow, UserStats
+from .utils import (COMMENT_ORDERING, COMMENTS_PER_PAGE, NUM_OF_PAGES,
+                    CursorPaginator, cached_count, page)
+
+
+def _feed_page(get_page):
+    # В потоковом режиме лента выбирается уже после отправки шапки
+    if settings.POSTS_STREAMING_VIEWS:
+        return SimpleLazyObject(get_page)
+    return get_page()
+
 
+def _render_feed(request, template_name, context):
+    if settings.POSTS_STREAMING_VIEWS:
+        return streaming.render(request, template_name,
+                                {**context, 'streaming': True})
+    return render(request, template_name, context)
 
+
+@etags.conditional(etags.index)
 def index(request):
 
     post_list = Post.objects.all()
 
     context = {
-        'page_obj': page(request, post_list),
+        'page_obj': _feed_page(lambda: page(
+            request, post_list, count=cached_count(post_list, 'index'))),
+        'feed_version': caching.feed_version(caching.INDEX),
+    }
+    return _render_feed(request, 'posts/index.html', context)
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': search.search_page(
+            query,
+            NUM_OF_PAGES,
+            request.GET.get('after'),
+            request.GET.get('before'),
+            request.GET,
+        ),
     }
-    return render(request, 'posts/index.html', context)
+    return render(request, 'posts/search.html', context)
 
 
+@etags.conditional(etags.group_list)
 def groups_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
 
@@ -23,39 +64,49 @@ def groups_posts(request, slug):
 
     context = {
         'group': group,
-        'page_obj': page(request, post_list)
+        'page_obj': _feed_page(lambda: page(
+            request, post_list,
+            count=cached_count(post_list, f'group:{group.pk}'))),
+        'feed_version': caching.feed_version(caching.group_scope(group.pk)),
     }
 
-    return render(request, 'posts/group_list.html', context)
+    return _render_feed(request, 'posts/group_list.html', context)
 
 
+@etags.conditional(etags.profile)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
 
     post_list = author.posts.all()
-    count_posts = post_list.count()
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author
-    ).exists()
+    stats = UserStats.objects.for_user(author)
+    following = request.user.is_authenticated and follow_graph.is_following(
+        request.user.pk, author.pk)
 
     context = {
         'username': username,
         'author': author,
-        'count_posts': count_posts,
-        'page_obj': page(request, post_list),
+        'count_posts': stats.posts_count,
+        'stats': stats,
+        'page_obj': page(request, post_list, count=stats.posts_count),
+        'feed_version': caching.feed_version(caching.author_scope(author.pk)),
         'following': following
     }
 
     return render(request, 'posts/profile.html', context)
 
 
+@etags.conditional(etags.post_detail)
 def post_detail(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
 
-    count_posts = post.author.posts.count()
+    count_posts = UserStats.objects.for_user(post.author).posts_count
 
     form = CommentForm()
-    comments = post.comments.select_related()
+    comments = CursorPaginator(
+        post.comments.select_related('author'),
+        COMMENTS_PER_PAGE,
+        COMMENT_ORDERING,
+    ).get_page()
 
     context = {
         'post': post,
@@ -67,6 +118,31 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующие страницы комментариев: HTML-фрагмент или JSON."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = CursorPaginator(
+        post.comments.select_related('author'),
+        COMMENTS_PER_PAGE,
+        COMMENT_ORDERING,
+    ).get_page(request.GET.get('after'), params=request.GET)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created,
+                }
+                for comment in comments
+            ],
+            'next': comments.next_cursor,
+        }, json_dumps_params={'ensure_ascii': False})
+    context = {'post': post, 'comments': comments}
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -77,6 +153,8 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.schedule(post)
         return redirect('posts:profile', username=post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -93,7 +171,12 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
+        image_changed = 'image' in form.changed_data
+        if image_changed:
+            post.thumbnails = {}
         form.save()
+        if image_changed and post.image:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -116,11 +199,35 @@ def add_comment(request, post_id):
 
 
 @login_required
+@etags.conditional(etags.follow_index)
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__user=request.user)
-    context = {'page_obj': page(request, post_list)}
-    return render(request, 'posts/follow.html', context)
+    if not timeline.enabled():
+        context = {
+            'page_obj': _feed_page(lambda: pull_feed.get_page(
+                request.user.pk,
+                NUM_OF_PAGES,
+                request.GET.get('after'),
+                request.GET.get('before'),
+                request.GET,
+            )),
+            'feed_version': pull_feed.version(request.user.pk),
+        }
+        return _render_feed(request, 'posts/follow.html', context)
+
+    def timeline_page():
+        entries = request.user.timeline.select_related('post__author',
+                                                       'post__group')
+        page_obj = page(request, entries, timeline.ORDERING, cached_count(
+            entries, f'follow:{request.user.pk}'))
+        page_obj.object_list = [entry.post for entry in page_obj]
+        return page_obj
+
+    context = {
+        'page_obj': _feed_page(timeline_page),
+        'feed_version': caching.feed_version(
+            caching.follow_scope(request.user.pk)),
+    }
+    return _render_feed(request, 'posts/follow.html', context)
 
 
 @login_required
@@ -41,7 +41,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,7 +60,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.ProfilingDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,18 +77,56 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Асинхронные версии страниц чтения; включаются в yatube.settings_asgi
+POSTS_ASYNC_VIEWS = False
+
+# Ленты index, group_list и follow отдаются потоком: <head> и шапка
+# уходят до запроса постов, карточки — по мере рендеринга. Только для
+# синхронных представлений: Django 4.1 перебирает поток в ASGI прямо в
+# цикле событий
+POSTS_STREAMING_VIEWS = False
+
+# Как строится /follow/: 'push' — из таблицы TimelineEntry, которую
+# заполняет каждый новый пост; 'pull' — слиянием кешированных списков
+# последних постов авторов, без записи в ленты подписчиков. После
+# возврата к 'push' ленты пересобирает rebuild_timelines
+FOLLOW_FEED_STRATEGY = 'push'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': str(os.path.join(BASE_DIR, "db.sqlite3"))
+        # sqlite3 с WAL, PRAGMA на соединение и BEGIN IMMEDIATE для
+        # записи (core.sqlite.base.read_only — обычный BEGIN)
+        'ENGINE': 'core.sqlite',
+        'NAME': str(os.path.join(BASE_DIR, "db.sqlite3")),
+        # Соединение живёт между запросами; проверка перед повторным
+        # использованием отбрасывает сломанные
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Секунды ожидания блокировки на уровне драйвера
+            'timeout': 20,
+            'pragmas': {
+                'busy_timeout': 20000,
+            },
+        },
     }
 }
 
 
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Псевдонимы реплик для чтения; пусто — всё идёт в default
+DATABASE_REPLICAS = []
+
+# Сколько секунд после записи клиент читает из основной базы
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = 'pin_primary'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -121,10 +163,21 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
+# Сборка: python manage.py collectstatic пишет сюда копии с хешем в
+# имени и сжатые .gz/.br; их отдаёт core.middleware.StaticFilesMiddleware
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'core.static.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Миниатюры картинок постов готовятся заранее, при загрузке
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Число фоновых потоков для миниатюр; 0 — готовить сразу после коммита
+THUMBNAIL_WORKERS = 2
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -143,8 +196,58 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# LRU в памяти воркера перед общим для всех воркеров кешем в SQLite
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 2000,
+            'LOCAL_MAX_BYTES': 32 * 1024 * 1024,
+            # Секунды жизни записи в LRU
+            'LOCAL_TIMEOUT': 60,
+            # Как часто читать журнал изменений общего кеша: задержка,
+            # с которой воркер видит перезаписи других воркеров
+            'SYNC_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+            # Секунды хранения журнала изменений; воркер, отставший
+            # сильнее, сбрасывает свой LRU целиком
+            'CHANGES_TIMEOUT': 300,
+            # Поколения лент (posts.caching) не вытесняются: сброшенный
+            # счётчик начался бы заново и мог вернуть старые фрагменты
+            'KEEP_KEYS': ['feed-version:'],
+        },
+    },
 }
+
+# Профилирование запросов: заголовок Server-Timing (только персоналу
+# или при DEBUG) и страница /stats/. Вне DEBUG выключено; в бою стоит
+# профилировать долю запросов, например SAMPLE_RATE = 0.01
+PROFILING = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0 if DEBUG else 0.0,
+    # Агрегаты по маршрутам за WINDOW отрезков по SLICE секунд
+    'SLICE': 60,
+    'WINDOW': 10,
+    'SLOW_QUERIES': 20,
+}
+
+# Метрики для Prometheus на /metrics. Каждый воркер пишет свой файл в
+# DIR, эндпоинт складывает их и требует Authorization: Bearer TOKEN;
+# пока TOKEN не задан, /metrics отвечает 404
+METRICS = {
+    'ENABLED': True,
+    'DIR': os.path.join(BASE_DIR, 'metrics'),
+    'FLUSH_INTERVAL': 5,
+    'TOKEN': None,
+}
+
+# Тесты получают общий кеш во временном файле, а не рабочий
+TEST_RUNNER = 'core.test_runner.DiscoverRunner'
@@ -0,0 +1,8 @@
+"""Профиль для запуска под ASGI-сервером (uvicorn, daphne).
+
+Страницы чтения обслуживаются async-представлениями, и один воркер
+перекрывает ожидание базы и кеша для многих одновременных читателей.
+"""
+from .settings import *  # noqa: F401, F403
+
+POSTS_ASYNC_VIEWS = True
@@ -0,0 +1,16 @@
+"""Профиль с репликой для чтения на втором файле SQLite.
+
+Реплика обновляется командой `manage.py replicate --interval N`
+(копия основной базы раз в N секунд), а core.routers направляет в неё
+чтения всех клиентов, которые недавно ничего не записывали.
+"""
+from .settings import *  # noqa: F401, F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': str(BASE_DIR / 'db_replica.sqlite3'),
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_REPLICAS = ['replica']
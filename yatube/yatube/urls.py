@@ -4,8 +4,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import metrics_view, profiling_stats
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('stats/', profiling_stats, name='profiling_stats'),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('posts.urls', namespace='posts')),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),